@@ -15,17 +15,19 @@
 from __future__ import absolute_import
 
 from builtins import object
+from concurrent.futures import ThreadPoolExecutor
 from past.builtins import basestring
 import base64
 import copy
+import functools
 import json
-import re
 import requests
-import six
+import threading
 import yaml
 
 from . import service_accounts
 
+from base import memoize
 from base import tasks
 from base import untrusted
 from base import utils
@@ -34,6 +36,7 @@ from config import local_config
 from datastore import data_handler
 from datastore import data_types
 from datastore import ndb
+from datastore import ndb_utils
 from fuzzing import fuzzer_selection
 from google_cloud_utils import pubsub
 from google_cloud_utils import storage
@@ -49,21 +52,28 @@ BACKUPS_LIFECYCLE = storage.generate_life_cycle_config('Delete', age=100)
 LOGS_LIFECYCLE = storage.generate_life_cycle_config('Delete', age=14)
 QUARANTINE_LIFECYCLE = storage.generate_life_cycle_config('Delete', age=90)
 
-JOB_TEMPLATE = ('{build_type} = {build_bucket_path}\n'
-                'PROJECT_NAME = {project}\n'
-                'SUMMARY_PREFIX = {project}\n'
+JOB_TEMPLATE = ('%(build_type)s = %(build_bucket_path)s\n'
+                'PROJECT_NAME = %(project)s\n'
+                'SUMMARY_PREFIX = %(project)s\n'
                 'MANAGED = True\n')
 
 OBJECT_VIEWER_IAM_ROLE = 'roles/storage.objectViewer'
 OBJECT_ADMIN_IAM_ROLE = 'roles/storage.objectAdmin'
 
-VALID_PROJECT_NAME_REGEX = re.compile(r'^[a-zA-Z0-9_-]+$')
-
 REVISION_URL = ('https://commondatastorage.googleapis.com/'
                 '{bucket}/{project}/{project}-{sanitizer}-%s.srcmap.json')
 
 REQUEST_TIMEOUT = 60
 
+# GitHub responses are revalidated with ETags, so they can be kept for long.
+GITHUB_CACHE_TTL = 60 * 60 * 24 * 30  # 30 days.
+GITHUB_CONNECTION_POOL_SIZE = 32
+GITHUB_FETCH_THREADS = 16
+
+PROJECT_SETUP_THREADS = 4
+BUCKET_SETUP_THREADS = 8
+PUBSUB_CLEANUP_THREADS = 16
+
 ALLOWED_VIEW_RESTRICTIONS = ['none', 'security', 'all']
 
 PUBSUB_PLATFORMS = ['linux']
@@ -117,32 +127,37 @@ LIBFUZZER_ASAN_I386_JOB = JobInfo(
     'address', ['engine_asan', 'libfuzzer'],
     architecture='i386')
 
+# Map of (engine, architecture, sanitizer) -> job.
 JOB_MAP = {
-    'libfuzzer': {
-        'x86_64': {
-            'address': LIBFUZZER_ASAN_JOB,
-            'memory': LIBFUZZER_MSAN_JOB,
-            'undefined': LIBFUZZER_UBSAN_JOB,
-        },
-        'i386': {
-            'address': LIBFUZZER_ASAN_I386_JOB,
-        },
-    },
-    'afl': {
-        'x86_64': {
-            'address': AFL_ASAN_JOB,
-        }
-    },
-    'none': {
-        'x86_64': {
-            'address': NO_ENGINE_ASAN_JOB,
-        }
-    }
+    ('libfuzzer', 'x86_64', 'address'): LIBFUZZER_ASAN_JOB,
+    ('libfuzzer', 'x86_64', 'memory'): LIBFUZZER_MSAN_JOB,
+    ('libfuzzer', 'x86_64', 'undefined'): LIBFUZZER_UBSAN_JOB,
+    ('libfuzzer', 'i386', 'address'): LIBFUZZER_ASAN_I386_JOB,
+    ('afl', 'x86_64', 'address'): AFL_ASAN_JOB,
+    ('none', 'x86_64', 'address'): NO_ENGINE_ASAN_JOB,
 }
 
-DEFAULT_ARCHITECTURES = ['x86_64']
-DEFAULT_SANITIZERS = ['address', 'undefined']
-DEFAULT_ENGINES = ['libfuzzer', 'afl']
+DEFAULT_ARCHITECTURES = ('x86_64',)
+DEFAULT_SANITIZERS = ('address', 'undefined')
+DEFAULT_ENGINES = ('libfuzzer', 'afl')
+
+# Thread local storage for discovery storage clients, which are not thread
+# safe.
+_local = threading.local()
+
+# Cache of GitHub API responses (ETag and parsed body), keyed by URL. Note that
+# MemcacheLarge does not pass its TTL on to memcache, so entries are only
+# dropped by memcache eviction. This is fine, since every use revalidates the
+# ETag.
+_github_cache = memoize.MemcacheLarge(GITHUB_CACHE_TTL)
+
+# Shared session so that connections to GitHub are reused across requests.
+_github_session = requests.Session()
+_github_session.mount(
+    'https://',
+    requests.adapters.HTTPAdapter(
+        pool_connections=GITHUB_CONNECTION_POOL_SIZE,
+        pool_maxsize=GITHUB_CONNECTION_POOL_SIZE))
 
 
 def _to_experimental_job(job_info):
@@ -151,69 +166,122 @@ def _to_experimental_job(job_info):
   return job_info
 
 
-def get_github_url(url):
-  """Return contents of URL."""
+def _get_github_credentials():
+  """Return the (client_id, client_secret) pair used for GitHub requests."""
   github_credentials = db_config.get_value('github_credentials')
   if not github_credentials:
     raise ProjectSetupError('No github credentials.')
 
-  client_id, client_secret = github_credentials.strip().split(';')
+  return github_credentials.strip().split(';')
+
 
-  response = requests.get(
-      url, params={
+def get_github_url(url, credentials=None):
+  """Return contents of URL."""
+  if not credentials:
+    credentials = _get_github_credentials()
+
+  client_id, client_secret = credentials
+
+  # Revalidate a previously cached response, if any. GitHub replies with a 304
+  # and no body when the content is unchanged.
+  cache_key = 'github:' + url
+  cached_response = _github_cache.get(cache_key)
+  headers = {}
+  if cached_response:
+    headers['If-None-Match'] = cached_response['etag']
+
+  response = _github_session.get(
+      url,
+      params={
           'client_id': client_id,
           'client_secret': client_secret
-      })
+      },
+      headers=headers)
+  if response.status_code == 304 and cached_response:
+    return cached_response['body']
+
   if response.status_code != 200:
     logs.log_error(
         'Failed to get github url: %s' % url, status_code=response.status_code)
     response.raise_for_status()
 
-  return json.loads(response.text)
+  result = json.loads(response.text)
+  etag = response.headers.get('ETag')
+  if etag:
+    _github_cache.put(cache_key, {'etag': etag, 'body': result})
+
+  return result
+
+
+def _index_github_tree(github_json):
+  """Return a map of path -> item for the items of a github tree response."""
+  return {item['path']: item for item in github_json['tree']}
 
 
 def find_github_item_url(github_json, name):
   """Get url of a blob/tree from a github json response."""
-  for item in github_json['tree']:
-    if item['path'] == name:
-      return item['url']
+  item = _index_github_tree(github_json).get(name)
+  if not item:
+    return None
+
+  return item['url']
+
+
+def _project_yaml_key_fn(func, args, kwargs):  # pylint: disable=unused-argument
+  """Memoize key function for _get_project_yaml. Only the blob SHA matters,
+  since blob contents never change for a given SHA."""
+  return 'project_yaml:' + args[0]
+
 
-  return None
+@memoize.wrap(memoize.Memcache(GITHUB_CACHE_TTL, key_fn=_project_yaml_key_fn))
+def _get_project_yaml(sha, url, credentials):
+  """Return the parsed project.yaml blob with the given |sha|."""
+  projects_yaml = get_github_url(url, credentials)
+  return yaml.safe_load(base64.b64decode(projects_yaml['content']))
+
+
+def _get_oss_fuzz_project(credentials, item):
+  """Return the (name, info) tuple for a project tree |item| or None if it is
+  not a valid project."""
+  if item['type'] != 'tree':
+    return None
+
+  project_items = _index_github_tree(get_github_url(item['url'], credentials))
+  project_yaml_item = project_items.get('project.yaml')
+  if not project_yaml_item:
+    return None
+
+  info = _get_project_yaml(project_yaml_item['sha'], project_yaml_item['url'],
+                           credentials)
+
+  has_dockerfile = 'Dockerfile' in project_items or 'dockerfile' in info
+  if not has_dockerfile:
+    return None
+
+  return item['path'], info
 
 
 def get_oss_fuzz_projects():
   """Return list of projects for oss-fuzz."""
+  credentials = _get_github_credentials()
   ossfuzz_tree_url = ('https://api.github.com/repos/google/oss-fuzz/'
                       'git/trees/master')
-  tree = get_github_url(ossfuzz_tree_url)
-  projects = []
+  tree = get_github_url(ossfuzz_tree_url, credentials)
 
   projects_url = find_github_item_url(tree, 'projects')
   if not projects_url:
     logs.log_error('No projects found.')
     return []
 
-  tree = get_github_url(projects_url)
-  for item in tree['tree']:
-    if item['type'] != 'tree':
-      continue
-
-    item_json = get_github_url(item['url'])
-    project_yaml_url = find_github_item_url(item_json, 'project.yaml')
-    if not project_yaml_url:
-      continue
-
-    projects_yaml = get_github_url(project_yaml_url)
-    info = yaml.safe_load(base64.b64decode(projects_yaml['content']))
-
-    has_dockerfile = (
-        find_github_item_url(item_json, 'Dockerfile') or 'dockerfile' in info)
-    if not has_dockerfile:
-      continue
+  tree = get_github_url(projects_url, credentials)
 
-    projects.append((item['path'], info))
+  # Fetching project metadata is dominated by network latency, so fetch
+  # projects in parallel.
+  with ThreadPoolExecutor(max_workers=GITHUB_FETCH_THREADS) as executor:
+    projects = executor.map(
+        functools.partial(_get_oss_fuzz_project, credentials), tree['tree'])
 
-  return projects
+  return [project for project in projects if project]
 
 
 def get_projects_from_gcs(gcs_url):
@@ -223,10 +291,10 @@ def get_projects_from_gcs(gcs_url):
 
 
 def _process_sanitizers_field(sanitizers):
-  """Pre-process sanitizers field into a map from sanitizer name -> dict of
-  options."""
+  """Pre-process sanitizers field into a tuple of (sanitizer name, dict of
+  options) pairs."""
   processed_sanitizers = {}
-  if not isinstance(sanitizers, list):
+  if not isinstance(sanitizers, (list, tuple)):
     return None
 
   # each field can either be a Map or a String:
@@ -239,12 +307,11 @@ def _process_sanitizers_field(sanitizers):
     if isinstance(sanitizer, basestring):
       processed_sanitizers[sanitizer] = {}
     elif isinstance(sanitizer, dict):
-      for key, value in six.iteritems(sanitizer):
-        processed_sanitizers[key] = value
+      processed_sanitizers.update(sanitizer)
     else:
       return None
 
-  return processed_sanitizers
+  return tuple(processed_sanitizers.items())
 
 
 def get_jobs_for_project(project, info):
@@ -260,23 +327,19 @@ def get_jobs_for_project(project, info):
 
   jobs = []
   for engine in engines:
-    if engine not in JOB_MAP:
-      continue
-
     for architecture in architectures:
-      if architecture not in JOB_MAP[engine]:
-        continue
+      for sanitizer, options in sanitizers:
+        job = JOB_MAP.get((engine, architecture, sanitizer))
+        if not job:
+          continue
 
-      for sanitizer, options in six.iteritems(sanitizers):
         experimental = (
             options.get('experimental', False) or
             info.get('experimental', False))
-        if sanitizer in JOB_MAP[engine][architecture]:
-          job = JOB_MAP[engine][architecture][sanitizer]
-          if experimental:
-            job = _to_experimental_job(job)
+        if experimental:
+          job = _to_experimental_job(job)
 
-          jobs.append(job)
+        jobs.append(job)
 
   return jobs
 
@@ -291,10 +354,10 @@ def convert_googlemail_to_gmail(email):
   return email
 
 
-def _add_users_to_bucket(info, client, bucket_name, iam_policy):
+def _add_users_to_bucket(ccs, client, bucket_name, iam_policy):
   """Add user account to bucket."""
-  ccs = sorted(
-      ['user:' + convert_googlemail_to_gmail(cc) for cc in ccs_from_info(info)])
+  ccs = sorted(['user:' + convert_googlemail_to_gmail(cc) for cc in ccs])
+  ccs_set = set(ccs)
   binding = storage.get_bucket_iam_binding(iam_policy, OBJECT_VIEWER_IAM_ROLE)
 
   if binding:
@@ -305,7 +368,7 @@ def _add_users_to_bucket(info, client, bucket_name, iam_policy):
       return iam_policy
 
     filtered_members = [
-        member for member in binding['members'] if member in ccs
+        member for member in binding['members'] if member in ccs_set
     ]
 
     if len(filtered_members) != len(binding['members']):
@@ -356,68 +419,101 @@ def _set_bucket_service_account(service_account, client, bucket_name,
   return storage.set_bucket_iam_policy(client, bucket_name, iam_policy)
 
 
-def add_bucket_iams(info, client, bucket_name, service_account):
+def add_bucket_iams(ccs, client, bucket_name, service_account):
   """Add CC'ed users to storage bucket IAM."""
   iam_policy = storage.get_bucket_iam_policy(client, bucket_name)
   if not iam_policy:
     return
 
-  iam_policy = _add_users_to_bucket(info, client, bucket_name, iam_policy)
+  iam_policy = _add_users_to_bucket(ccs, client, bucket_name, iam_policy)
   _set_bucket_service_account(service_account, client, bucket_name, iam_policy)
 
 
-def add_service_account_to_bucket(client, bucket_name, service_account, role):
-  """Add service account to the gcr.io images bucket."""
+def add_service_accounts_to_bucket(client, bucket_name, service_accounts,
+                                   role):
+  """Add service accounts to a shared bucket (such as the gcr.io images
+  bucket) with a single IAM policy update."""
   iam_policy = storage.get_bucket_iam_policy(client, bucket_name)
   if not iam_policy:
     return
 
   binding = storage.get_or_create_bucket_iam_binding(iam_policy, role)
 
-  member = 'serviceAccount:' + service_account['email']
-  if member in binding['members']:
+  existing_members = set(binding['members'])
+  new_members = sorted(
+      set('serviceAccount:' + service_account['email']
+          for service_account in service_accounts) - existing_members)
+  if not new_members:
     # No changes required.
     return
 
-  binding['members'].append(member)
+  binding['members'].extend(new_members)
   storage.set_bucket_iam_policy(client, bucket_name, iam_policy)
 
 
-def sync_user_permissions(project, info):
+def _discovery_storage_client():
+  """Get the discovery storage client for the current thread, creating it if it
+  does not exist."""
+  if not hasattr(_local, 'storage_client'):
+    _local.storage_client = storage.create_discovery_storage_client()
+
+  return _local.storage_client
+
+
+def _run_in_thread_pool(thread_pool, function, args_list):
+  """Run |function| with each argument tuple in |args_list| on |thread_pool|
+  and wait for all of them to finish. Returns the list of results."""
+  futures = [thread_pool.submit(function, *args) for args in args_list]
+  return [future.result() for future in futures]
+
+
+def _add_project_bucket_iams(project, ccs, bucket_name, service_account):
+  """Add bucket IAMs for a project bucket, logging any failures."""
+  try:
+    add_bucket_iams(ccs, _discovery_storage_client(), bucket_name,
+                    service_account)
+  except Exception as e:
+    logs.log_error('Failed to add bucket IAMs for %s: %s' % (project, e))
+
+
+def _add_service_accounts_to_bucket(bucket_name, service_accounts, role):
+  """Add service accounts to a bucket using the current thread's client."""
+  add_service_accounts_to_bucket(_discovery_storage_client(), bucket_name,
+                                 service_accounts, role)
+
+
+def sync_user_permissions(project, info, ccs):
   """Sync permissions of project based on project.yaml."""
-  ccs = ccs_from_info(info)
+  ccs = set(ccs)
 
   for template in get_jobs_for_project(project, info):
     job_name = template.job_name(project)
 
+    existing_permissions = list(
+        data_types.ExternalUserPermission.query(
+            data_types.ExternalUserPermission.entity_kind ==
+            data_types.PermissionEntityKind.JOB,
+            data_types.ExternalUserPermission.entity_name == job_name))
+    existing_emails = set(
+        permission.email for permission in existing_permissions)
+
     # Delete removed CCs.
-    existing_ccs = data_types.ExternalUserPermission.query(
-        data_types.ExternalUserPermission.entity_kind ==
-        data_types.PermissionEntityKind.JOB,
-        data_types.ExternalUserPermission.entity_name == job_name)
     ndb.delete_multi([
         permission.key
-        for permission in existing_ccs
+        for permission in existing_permissions
         if permission.email not in ccs
     ])
 
-    for cc in ccs:
-      query = data_types.ExternalUserPermission.query(
-          data_types.ExternalUserPermission.email == cc,
-          data_types.ExternalUserPermission.entity_kind ==
-          data_types.PermissionEntityKind.JOB,
-          data_types.ExternalUserPermission.entity_name == job_name)
-
-      existing_permission = query.get()
-      if existing_permission:
-        continue
-
-      data_types.ExternalUserPermission(
-          email=cc,
-          entity_kind=data_types.PermissionEntityKind.JOB,
-          entity_name=job_name,
-          is_prefix=False,
-          auto_cc=data_types.AutoCCType.ALL).put()
+    # Add new CCs.
+    ndb.put_multi([
+        data_types.ExternalUserPermission(
+            email=cc,
+            entity_kind=data_types.PermissionEntityKind.JOB,
+            entity_name=job_name,
+            is_prefix=False,
+            auto_cc=data_types.AutoCCType.ALL)
+        for cc in ccs - existing_emails
+    ])
 
 
 def ccs_from_info(info):
@@ -442,11 +538,13 @@ def ccs_from_info(info):
   return [utils.normalize_email(cc) for cc in ccs]
 
 
-def update_fuzzer_jobs(fuzzer_entities, project_names):
-  """Update fuzzer job mappings."""
+def update_fuzzer_jobs(fuzzer_entities, jobs, project_names):
+  """Update fuzzer job mappings. |jobs| are all existing jobs."""
   to_delete = []
+  job_names_to_delete = set()
+  project_names = set(project_names)
 
-  for job in data_types.Job.query():
+  for job in jobs:
     if not job.environment_string:
       continue
 
@@ -459,14 +557,16 @@ def update_fuzzer_jobs(fuzzer_entities, project_names):
       continue
 
     to_delete.append(job.key)
-    for fuzzer_entity in fuzzer_entities:
-      try:
-        fuzzer_entity.jobs.remove(job.name)
-      except ValueError:
-        pass
+    job_names_to_delete.add(job.name)
 
   for fuzzer_entity in fuzzer_entities:
-    fuzzer_entity.put()
+    fuzzer_entity.jobs = [
+        job_name for job_name in fuzzer_entity.jobs
+        if job_name not in job_names_to_delete
+    ]
+
+  ndb.put_multi(fuzzer_entities)
+  for fuzzer_entity in fuzzer_entities:
     fuzzer_selection.update_mappings_for_fuzzer(fuzzer_entity)
 
   if to_delete:
@@ -477,7 +577,9 @@ def cleanup_old_projects_settings(project_names):
   """Delete old projects that are no longer used or disabled."""
   to_delete = []
 
-  for project in data_types.OssFuzzProject.query():
+  project_names = set(project_names)
+  for project in data_types.OssFuzzProject.query(
+      projection=[data_types.OssFuzzProject.name]):
     if project.name not in project_names:
       to_delete.append(project.key)
 
@@ -485,7 +587,7 @@ def cleanup_old_projects_settings(project_names):
     ndb.delete_multi(to_delete)
 
 
-def create_project_settings(project, info, service_account):
+def create_project_settings(project, info, service_account, ccs):
   """Setup settings for ClusterFuzz (such as CPU distribution)."""
   key = ndb.Key(data_types.OssFuzzProject, project)
   oss_fuzz_project = key.get()
@@ -493,19 +595,21 @@ def create_project_settings(project, info, service_account):
   # Expecting to run a blackbox fuzzer, so use high end hosts.
   is_high_end = info.get('fuzzing_engines') == ['none']
 
-  ccs = ccs_from_info(info)
-
   if oss_fuzz_project:
+    needs_update = False
     if oss_fuzz_project.service_account != service_account['email']:
       oss_fuzz_project.service_account = service_account['email']
-      oss_fuzz_project.put()
+      needs_update = True
 
     if oss_fuzz_project.high_end != is_high_end:
       oss_fuzz_project.high_end = is_high_end
-      oss_fuzz_project.put()
+      needs_update = True
 
     if oss_fuzz_project.ccs != ccs:
       oss_fuzz_project.ccs = ccs
+      needs_update = True
+
+    if needs_update:
       oss_fuzz_project.put()
   else:
     data_types.OssFuzzProject(
@@ -516,13 +620,10 @@ def create_project_settings(project, info, service_account):
         ccs=ccs).put()
 
 
-def create_pubsub_topics(project):
+def create_pubsub_topics(client, application_id, project):
   """Create pubsub topics for tasks."""
   for platform in PUBSUB_PLATFORMS:
     name = untrusted.queue_name(project, platform)
-    client = pubsub.PubSubClient()
-    application_id = utils.get_application_id()
-
     topic_name = pubsub.topic_name(application_id, name)
     if client.get_topic(topic_name) is None:
       client.create_topic(topic_name)
@@ -532,11 +633,8 @@ def create_pubsub_topics(project):
       client.create_subscription(subscription_name, topic_name)
 
 
-def cleanup_pubsub_topics(project_names):
+def cleanup_pubsub_topics(client, application_id, project_names):
   """Delete old pubsub topics and subscriptions."""
-  client = pubsub.PubSubClient()
-  application_id = utils.get_application_id()
-
   expected_topics = set()
   for platform in PUBSUB_PLATFORMS:
     expected_topics.update(
@@ -545,6 +643,7 @@ def cleanup_pubsub_topics(project_names):
   pubsub_config = local_config.Config('pubsub.queues')
   unmanaged_queues = [queue['name'] for queue in pubsub_config.get('resources')]
 
+  topics_to_delete = []
   for topic in client.list_topics(pubsub.project_name(application_id)):
     _, name = pubsub.parse_name(topic)
 
@@ -559,10 +658,26 @@ def cleanup_pubsub_topics(project_names):
     if name in expected_topics:
       continue
 
-    for subscription in client.list_topic_subscriptions(topic):
-      client.delete_subscription(subscription)
+    topics_to_delete.append((topic,))
 
-    client.delete_topic(topic)
+  if not topics_to_delete:
+    return
+
+  # Deletions are independent of each other, so run them in parallel. All
+  # subscriptions are deleted before their topics.
+  with ThreadPoolExecutor(max_workers=PUBSUB_CLEANUP_THREADS) as thread_pool:
+    topic_subscriptions = _run_in_thread_pool(
+        thread_pool, lambda topic: list(client.list_topic_subscriptions(topic)),
+        topics_to_delete)
+
+    subscriptions_to_delete = []
+    for subscriptions in topic_subscriptions:
+      subscriptions_to_delete.extend(
+          (subscription,) for subscription in subscriptions)
+
+    _run_in_thread_pool(thread_pool, client.delete_subscription,
+                        subscriptions_to_delete)
+    _run_in_thread_pool(thread_pool, client.delete_topic, topics_to_delete)
 
 
 class ProjectSetup(object):
@@ -587,6 +702,12 @@ class ProjectSetup(object):
     self._add_info_labels = add_info_labels
     self._add_revision_mappings = add_revision_mappings
     self._additional_vars = additional_vars
+    self._bucket_domain_suffix = data_handler.bucket_domain_suffix()
+    self._thread_pool = None
+    self._application_id = utils.get_application_id()
+    self._pubsub_client = None
+    self._service_accounts = []
+    self._project_iam_lock = threading.Lock()
 
   def _get_build_bucket(self, engine, architecture):
     """Return the bucket for the given |engine| and |architecture|."""
@@ -601,7 +722,7 @@ class ProjectSetup(object):
 
   def _deployment_bucket_name(self):
     """Deployment bucket name."""
-    return '{project}-deployment'.format(project=utils.get_application_id())
+    return '{project}-deployment'.format(project=self._application_id)
 
   def _shared_corpus_bucket_name(self):
     """Shared corpus bucket name."""
@@ -613,24 +734,28 @@ class ProjectSetup(object):
 
   def _backup_bucket_name(self, project_name):
     """Return the backup_bucket_name."""
-    return project_name + '-backup.' + data_handler.bucket_domain_suffix()
+    return project_name + '-backup.' + self._bucket_domain_suffix
 
   def _corpus_bucket_name(self, project_name):
     """Return the corpus_bucket_name."""
-    return project_name + '-corpus.' + data_handler.bucket_domain_suffix()
+    return project_name + '-corpus.' + self._bucket_domain_suffix
 
   def _quarantine_bucket_name(self, project_name):
     """Return the quarantine_bucket_name."""
-    return project_name + '-quarantine.' + data_handler.bucket_domain_suffix()
+    return project_name + '-quarantine.' + self._bucket_domain_suffix
 
   def _logs_bucket_name(self, project_name):
     """Return the logs bucket name."""
-    return project_name + '-logs.' + data_handler.bucket_domain_suffix()
+    return project_name + '-logs.' + self._bucket_domain_suffix
 
-  def _create_service_accounts_and_buckets(self, project, info):
+  def _create_service_accounts_and_buckets(self, project, ccs):
     """Create per-project service account and buckets."""
     service_account = service_accounts.get_or_create_service_account(project)
-    service_accounts.set_service_account_roles(service_account)
+
+    # Projects are set up in parallel, but they all share the same project IAM
+    # policy. Serialize its updates to avoid conflicting writes.
+    with self._project_iam_lock:
+      service_accounts.set_service_account_roles(service_account)
 
     # Create GCS buckets.
     backup_bucket_name = self._backup_bucket_name(project)
@@ -638,29 +763,37 @@ class ProjectSetup(object):
     logs_bucket_name = self._logs_bucket_name(project)
     quarantine_bucket_name = self._quarantine_bucket_name(project)
 
-    storage.create_bucket_if_needed(backup_bucket_name, BACKUPS_LIFECYCLE)
-    storage.create_bucket_if_needed(corpus_bucket_name)
-    storage.create_bucket_if_needed(quarantine_bucket_name,
-                                    QUARANTINE_LIFECYCLE)
-    storage.create_bucket_if_needed(logs_bucket_name, LOGS_LIFECYCLE)
+    # Bucket operations are independent of each other and dominated by
+    # network latency, so run them in parallel.
+    _run_in_thread_pool(self._thread_pool, storage.create_bucket_if_needed, [
+        (backup_bucket_name, BACKUPS_LIFECYCLE),
+        (corpus_bucket_name,),
+        (quarantine_bucket_name, QUARANTINE_LIFECYCLE),
+        (logs_bucket_name, LOGS_LIFECYCLE),
+    ])
 
-    client = storage.create_discovery_storage_client()
-    try:
-      add_bucket_iams(info, client, backup_bucket_name, service_account)
-      add_bucket_iams(info, client, corpus_bucket_name, service_account)
-      add_bucket_iams(info, client, logs_bucket_name, service_account)
-      add_bucket_iams(info, client, quarantine_bucket_name, service_account)
-    except Exception as e:
-      logs.log_error('Failed to add bucket IAMs for %s: %s' % (project, e))
-
-    # Grant the service account read access to deployment, shared corpus and
-    # mutator plugin buckets.
-    add_service_account_to_bucket(client, self._deployment_bucket_name(),
-                                  service_account, OBJECT_VIEWER_IAM_ROLE)
-    add_service_account_to_bucket(client, self._shared_corpus_bucket_name(),
-                                  service_account, OBJECT_VIEWER_IAM_ROLE)
-    add_service_account_to_bucket(client, self._mutator_plugins_bucket_name(),
-                                  service_account, OBJECT_VIEWER_IAM_ROLE)
+    _run_in_thread_pool(self._thread_pool, _add_project_bucket_iams, [
+        (project, ccs, bucket_name, service_account)
+        for bucket_name in (backup_bucket_name, corpus_bucket_name,
+                            logs_bucket_name, quarantine_bucket_name)
+    ])
+
+    return (service_account, backup_bucket_name, corpus_bucket_name,
+            logs_bucket_name, quarantine_bucket_name)
+
+  def _add_service_accounts_to_shared_buckets(self):
+    """Grant the project service accounts read access to deployment, shared
+    corpus, mutator plugin and data bundle buckets. These buckets are shared
+    by all projects, so each of them is updated once for all service
+    accounts."""
+    if not self._service_accounts:
+      return
+
+    shared_bucket_names = [
+        self._deployment_bucket_name(),
+        self._shared_corpus_bucket_name(),
+        self._mutator_plugins_bucket_name(),
+    ]
 
     data_bundles = set([
         fuzzer_entity.data_bundle_name
@@ -668,13 +801,13 @@ class ProjectSetup(object):
     ])
     for data_bundle in data_bundles:
       # Workers also need to be able to set up these global bundles.
-      data_bundle_bucket_name = data_handler.get_data_bundle_bucket_name(
-          data_bundle)
-      add_service_account_to_bucket(client, data_bundle_bucket_name,
-                                    service_account, OBJECT_VIEWER_IAM_ROLE)
+      shared_bucket_names.append(
+          data_handler.get_data_bundle_bucket_name(data_bundle))
 
-    return (service_account, backup_bucket_name, corpus_bucket_name,
-            logs_bucket_name, quarantine_bucket_name)
+    _run_in_thread_pool(self._thread_pool, _add_service_accounts_to_bucket, [
+        (bucket_name, self._service_accounts, OBJECT_VIEWER_IAM_ROLE)
+        for bucket_name in shared_bucket_names
+    ])
 
   def _get_build_bucket_path(self, project_name, info, engine, memory_tool,
                              architecture):
@@ -691,9 +824,45 @@ class ProjectSetup(object):
     build_path = build_path.replace('%SANITIZER%', memory_tool)
     return build_path
 
-  def _sync_job(self, project, info, corpus_bucket_name, quarantine_bucket_name,
-                logs_bucket_name, backup_bucket_name):
-    """Sync the config with ClusterFuzz."""
+  def _sync_job(self, project, info, existing_jobs, corpus_bucket_name,
+                quarantine_bucket_name, logs_bucket_name, backup_bucket_name):
+    """Sync the config with ClusterFuzz. Returns the list of new or changed
+    jobs to be written, and the list of (engine, job name) pairs of jobs to
+    enable."""
+    jobs = []
+    jobs_to_enable = []
+
+    # Environment lines that are the same for every job of the project are
+    # only built once.
+    bucket_environment = ''.join(
+        '%s = %s\n' % (key, value)
+        for key, value in (('FUZZ_LOGS_BUCKET', logs_bucket_name),
+                           ('CORPUS_BUCKET', corpus_bucket_name),
+                           ('QUARANTINE_BUCKET', quarantine_bucket_name),
+                           ('BACKUP_BUCKET', backup_bucket_name))
+        if value)
+
+    help_url = info.get('help_url')
+    help_url_environment = 'HELP_URL = %s\n' % help_url if help_url else ''
+
+    project_environment = ''
+    view_restrictions = info.get('view_restrictions')
+    if view_restrictions:
+      if view_restrictions in ALLOWED_VIEW_RESTRICTIONS:
+        project_environment += (
+            'ISSUE_VIEW_RESTRICTIONS = %s\n' % view_restrictions)
+      else:
+        logs.log_error('Invalid view restriction setting %s for project %s.' %
+                       (view_restrictions, project))
+
+    selective_unpack = info.get('selective_unpack')
+    if selective_unpack:
+      project_environment += 'UNPACK_ALL_FUZZ_TARGETS_AND_FILES = False\n'
+
+    # Only looked up once a job needs it, as projects without libFuzzer x86_64
+    # jobs may not have a dataflow build bucket.
+    dataflow_environment = None
+
     # Create/update ClusterFuzz jobs.
     for template in get_jobs_for_project(project, info):
       if template.engine == 'none':
@@ -705,13 +874,18 @@ class ProjectSetup(object):
         raise ProjectSetupError('Invalid fuzzing engine ' + template.engine)
 
       job_name = template.job_name(project)
-      job = data_types.Job.query(data_types.Job.name == job_name).get()
-      if not job:
+      job = existing_jobs.get(job_name)
+      if job:
+        old_job_values = (job.platform, list(job.templates),
+                          job.environment_string)
+      else:
         job = data_types.Job()
+        old_job_values = None
 
       if job_name not in fuzzer_entity.jobs and not info.get('disabled', False):
-        # Enable new job.
-        fuzzer_entity.jobs.append(job_name)
+        # Enable new job. This is applied to the shared fuzzer entity by
+        # set_up, so that projects set up in parallel don't race on it.
+        jobs_to_enable.append((template.engine, job_name))
 
       job.name = job_name
       if self._segregate_projects:
@@ -722,13 +896,16 @@ class ProjectSetup(object):
 
       job.templates = template.cf_job_templates
 
-      job.environment_string = JOB_TEMPLATE.format(
-          build_type=self._build_type,
-          build_bucket_path=self._get_build_bucket_path(
-              project, info, template.engine, template.memory_tool,
-              template.architecture),
-          engine=template.engine,
-          project=project)
+      build_bucket_path = self._get_build_bucket_path(
+          project, info, template.engine, template.memory_tool,
+          template.architecture)
+      environment_lines = [
+          JOB_TEMPLATE % {
+              'build_type': self._build_type,
+              'build_bucket_path': build_bucket_path,
+              'project': project,
+          }
+      ]
 
       if self._add_revision_mappings:
         revision_vars_url = self._revision_url_template.format(
@@ -737,72 +914,43 @@ class ProjectSetup(object):
                                           template.architecture),
             sanitizer=template.memory_tool)
 
-        job.environment_string += (
-            'REVISION_VARS_URL = {revision_vars_url}\n'.format(
-                revision_vars_url=revision_vars_url))
-
-      if logs_bucket_name:
-        job.environment_string += 'FUZZ_LOGS_BUCKET = {logs_bucket}\n'.format(
-            logs_bucket=logs_bucket_name)
+        environment_lines.append('REVISION_VARS_URL = %s\n' % revision_vars_url)
 
-      if corpus_bucket_name:
-        job.environment_string += 'CORPUS_BUCKET = {corpus_bucket}\n'.format(
-            corpus_bucket=corpus_bucket_name)
-
-      if quarantine_bucket_name:
-        job.environment_string += (
-            'QUARANTINE_BUCKET = {quarantine_bucket}\n'.format(
-                quarantine_bucket=quarantine_bucket_name))
-
-      if backup_bucket_name:
-        job.environment_string += 'BACKUP_BUCKET = {backup_bucket}\n'.format(
-            backup_bucket=backup_bucket_name)
+      environment_lines.append(bucket_environment)
 
       if self._add_info_labels:
-        job.environment_string += (
-            'AUTOMATIC_LABELS = Proj-{project},Engine-{engine}\n'.format(
-                project=project,
-                engine=template.engine,
-            ))
+        environment_lines.append('AUTOMATIC_LABELS = Proj-%s,Engine-%s\n' %
+                                 (project, template.engine))
 
-      help_url = info.get('help_url')
-      if help_url:
-        job.environment_string += 'HELP_URL = %s\n' % help_url
+      environment_lines.append(help_url_environment)
 
       if template.experimental:
-        job.environment_string += 'EXPERIMENTAL = True\n'
+        environment_lines.append('EXPERIMENTAL = True\n')
 
       if template.minimize_job_override:
         minimize_job_override = template.minimize_job_override.job_name(project)
-        job.environment_string += (
+        environment_lines.append(
             'MINIMIZE_JOB_OVERRIDE = %s\n' % minimize_job_override)
 
-      view_restrictions = info.get('view_restrictions')
-      if view_restrictions:
-        if view_restrictions in ALLOWED_VIEW_RESTRICTIONS:
-          job.environment_string += (
-              'ISSUE_VIEW_RESTRICTIONS = %s\n' % view_restrictions)
-        else:
-          logs.log_error('Invalid view restriction setting %s for project %s.' %
-                         (view_restrictions, project))
-
-      selective_unpack = info.get('selective_unpack')
-      if selective_unpack:
-        job.environment_string += 'UNPACK_ALL_FUZZ_TARGETS_AND_FILES = False\n'
+      environment_lines.append(project_environment)
 
       if (template.engine == 'libfuzzer' and
           template.architecture == 'x86_64' and
           'dataflow' in info.get('fuzzing_engines', DEFAULT_ENGINES)):
-        # Dataflow binaries are built with dataflow sanitizer, but can be used
-        # as an auxiliary build with libFuzzer builds (e.g. with ASan or UBSan).
-        dataflow_build_bucket_path = self._get_build_bucket_path(
-            project_name=project,
-            info=info,
-            engine='dataflow',
-            memory_tool='dataflow',
-            architecture=template.architecture)
-        job.environment_string += (
-            'DATAFLOW_BUILD_BUCKET_PATH = %s\n' % dataflow_build_bucket_path)
+        if dataflow_environment is None:
+          # Dataflow binaries are built with dataflow sanitizer, but can be
+          # used as an auxiliary build with libFuzzer builds (e.g. with ASan or
+          # UBSan).
+          dataflow_build_bucket_path = self._get_build_bucket_path(
+              project_name=project,
+              info=info,
+              engine='dataflow',
+              memory_tool='dataflow',
+              architecture='x86_64')
+          dataflow_environment = (
+              'DATAFLOW_BUILD_BUCKET_PATH = %s\n' % dataflow_build_bucket_path)
+
+        environment_lines.append(dataflow_environment)
 
       if self._additional_vars:
         additional_vars = {}
@@ -812,48 +960,122 @@ class ProjectSetup(object):
         engine_sanitizer_vars = engine_vars.get(template.memory_tool, {})
         additional_vars.update(engine_sanitizer_vars)
 
-        for key, value in six.iteritems(additional_vars):
-          job.environment_string += ('{} = {}\n'.format(key, value))
+        for key, value in additional_vars.items():
+          environment_lines.append('%s = %s\n' % (key, value))
 
-      job.put()
+      job.environment_string = ''.join(environment_lines)
 
-  def set_up(self, projects):
-    """Do project setup."""
-    for project, info in projects:
-      logs.log('Syncing configs for %s.' % project)
+      new_job_values = (job.platform, job.templates, job.environment_string)
+      if new_job_values == old_job_values:
+        # No changes required.
+        continue
 
-      backup_bucket_name = None
-      corpus_bucket_name = None
-      logs_bucket_name = None
-      quarantine_bucket_name = None
+      jobs.append(job)
 
-      if self._segregate_projects:
-        # Create per project service account and GCS buckets.
-        (service_account, backup_bucket_name, corpus_bucket_name,
-         logs_bucket_name, quarantine_bucket_name) = (
-             self._create_service_accounts_and_buckets(project, info))
+    return jobs, jobs_to_enable
 
-      # Create CF jobs for project.
-      self._sync_job(project, info, corpus_bucket_name, quarantine_bucket_name,
-                     logs_bucket_name, backup_bucket_name)
+  def _set_up_project(self, project, info, existing_jobs):
+    """Do setup for a single project. Returns the list of jobs to be written,
+    the list of (engine, job name) pairs of jobs to enable and the project's
+    service account (None if projects are not segregated)."""
+    logs.log('Syncing configs for %s.' % project)
 
-      if self._segregate_projects:
-        sync_user_permissions(project, info)
+    service_account = None
+    backup_bucket_name = None
+    corpus_bucket_name = None
+    logs_bucket_name = None
+    quarantine_bucket_name = None
+
+    if self._segregate_projects:
+      ccs = ccs_from_info(info)
 
-        # Create Pub/Sub topics for tasks.
-        create_pubsub_topics(project)
+      # Create per project service account and GCS buckets.
+      (service_account, backup_bucket_name, corpus_bucket_name,
+       logs_bucket_name, quarantine_bucket_name) = (
+           self._create_service_accounts_and_buckets(project, ccs))
 
-        # Set up projects settings (such as CPU distribution settings).
-        if not info.get('disabled', False):
-          create_project_settings(project, info, service_account)
+    # Create CF jobs for project.
+    jobs, jobs_to_enable = self._sync_job(
+        project, info, existing_jobs, corpus_bucket_name,
+        quarantine_bucket_name, logs_bucket_name, backup_bucket_name)
+
+    if self._segregate_projects:
+      sync_user_permissions(project, info, ccs)
+
+      # Create Pub/Sub topics for tasks.
+      create_pubsub_topics(self._pubsub_client, self._application_id, project)
+
+      # Set up projects settings (such as CPU distribution settings).
+      if not info.get('disabled', False):
+        create_project_settings(project, info, service_account, ccs)
+
+    return jobs, jobs_to_enable, service_account
+
+  def set_up(self, projects):
+    """Do project setup."""
+    existing_jobs = {
+        job.name: job for job in ndb_utils.get_all_from_model(data_types.Job)
+    }
+    jobs = []
+
+    self._service_accounts = []
+    if self._segregate_projects:
+      # Share a single client so that its API clients are only built once.
+      self._pubsub_client = pubsub.PubSubClient()
+
+    # Projects are independent of each other, so set them up in parallel.
+    # Bucket operations use a separate thread pool, since project setup waits
+    # for them to finish.
+    project_thread_pool = ThreadPoolExecutor(max_workers=PROJECT_SETUP_THREADS)
+    self._thread_pool = ThreadPoolExecutor(max_workers=BUCKET_SETUP_THREADS)
+    failed_projects = []
+    try:
+      futures = [
+          project_thread_pool.submit(self._set_up_project, project, info,
+                                     existing_jobs)
+          for project, info in projects
+      ]
+
+      # Merge the per project results in project order, so that the order of
+      # fuzzer jobs and service accounts doesn't depend on thread timing.
+      for (project, _), future in zip(projects, futures):
+        try:
+          project_jobs, jobs_to_enable, service_account = future.result()
+        except Exception as e:
+          # Don't lose the updates to all other projects because of a single
+          # bad project config.
+          logs.log_error('Failed to set up %s: %s' % (project, e))
+          failed_projects.append(project)
+          continue
+
+        jobs.extend(project_jobs)
+
+        for engine, job_name in jobs_to_enable:
+          fuzzer_jobs = self._fuzzer_entities[engine].jobs
+          if job_name not in fuzzer_jobs:
+            fuzzer_jobs.append(job_name)
+
+        if self._segregate_projects:
+          self._service_accounts.append(service_account)
+
+      self._add_service_accounts_to_shared_buckets()
+    finally:
+      project_thread_pool.shutdown()
+      self._thread_pool.shutdown()
+      self._thread_pool = None
+
+    ndb.put_multi(jobs)
 
     # Delete old jobs.
     project_names = [project[0] for project in projects]
-    update_fuzzer_jobs(self._fuzzer_entities.values(), project_names)
+    update_fuzzer_jobs(
+        list(self._fuzzer_entities.values()), existing_jobs.values(),
+        project_names)
 
     if self._segregate_projects:
       # Delete old pubsub topics.
-      cleanup_pubsub_topics(project_names)
+      cleanup_pubsub_topics(self._pubsub_client, self._application_id,
+                            project_names)
 
     # Delete old/disabled project settings.
     enabled_projects = [
@@ -862,6 +1084,10 @@ class ProjectSetup(object):
     ]
     cleanup_old_projects_settings(enabled_projects)
 
+    if failed_projects:
+      raise ProjectSetupError(
+          'Failed to set up projects: ' + ', '.join(failed_projects))
+
 
 class Handler(base_handler.Handler):
   """Setup ClusterFuzz jobs for projects."""
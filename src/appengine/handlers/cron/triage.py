@@ -14,17 +14,19 @@
 """Automated bug filing."""
 from __future__ import absolute_import
 
+from builtins import range
+from concurrent.futures import ThreadPoolExecutor
 import datetime
+import functools
 import itertools
-import json
 
 from . import grouper
 
 from base import dates
-from base import errors
 from base import utils
 from datastore import data_handler
 from datastore import data_types
+from datastore import ndb
 from datastore import ndb_utils
 from handlers import base_handler
 from libs import handler
@@ -38,6 +40,8 @@ UNREPRODUCIBLE_CRASH_IGNORE_CRASH_TYPES = [
     'Hang', 'Out-of-memory', 'Stack-overflow', 'Timeout'
 ]
 TRIAGE_MESSAGE_KEY = 'triage_message'
+TESTCASE_FETCH_BATCH_SIZE = 200
+TRIAGE_THREADS = 8
 
 
 def _add_triage_message(testcase, message):
@@ -45,9 +49,16 @@ def _add_triage_message(testcase, message):
   if testcase.get_metadata(TRIAGE_MESSAGE_KEY) == message:
     # Message already exists, skip update.
     return
-  # Re-fetch testcase to get latest entity and avoid race condition in updates.
-  testcase = data_handler.get_testcase_by_id(testcase.key.id())
-  testcase.set_metadata(TRIAGE_MESSAGE_KEY, message)
+
+  def _try_set_triage_message():
+    """Set the triage message on the latest version of the testcase."""
+    latest_testcase = testcase.key.get()
+    if latest_testcase:
+      latest_testcase.set_metadata(TRIAGE_MESSAGE_KEY, message)
+
+  # Use a transaction to avoid race conditions with other testcase updates.
+  ndb.transaction(
+      _try_set_triage_message, retries=data_handler.DEFAULT_FAIL_RETRIES)
 
 
 def _associate_testcase_with_existing_issue_if_needed(testcase,
@@ -74,7 +85,8 @@ def _associate_testcase_with_existing_issue_if_needed(testcase,
   if data_types.Testcase.query(
       data_types.Testcase.bug_information == str(issue.id),
       ndb_utils.is_true(data_types.Testcase.open),
-      ndb_utils.is_false(data_types.Testcase.one_time_crasher_flag)).get():
+      ndb_utils.is_false(data_types.Testcase.one_time_crasher_flag)).get(
+          keys_only=True):
     return
 
   # If similar testcase is reproducible, make sure that it is not recently
@@ -96,10 +108,18 @@ def _associate_testcase_with_existing_issue_if_needed(testcase,
                  job_type=testcase.job_type, report_url=report_url)
   issue.save(new_comment=comment, notify=True)
 
-  testcase = data_handler.get_testcase_by_id(testcase_id)
-  testcase.bug_information = str(issue.id)
-  testcase.group_bug_information = 0
-  testcase.put()
+  def _try_update_bug_information():
+    """Associate the latest version of the testcase with the issue."""
+    latest_testcase = data_types.Testcase.get_by_id(testcase_id)
+    if not latest_testcase or latest_testcase.bug_information:
+      return
+
+    latest_testcase.bug_information = str(issue.id)
+    latest_testcase.group_bug_information = 0
+    latest_testcase.put()
+
+  ndb.transaction(
+      _try_update_bug_information, retries=data_handler.DEFAULT_FAIL_RETRIES)
 
 
 def _create_filed_bug_metadata(testcase):
@@ -117,8 +137,8 @@ def _create_filed_bug_metadata(testcase):
 
 
 def _get_excluded_jobs():
-  """Return list of jobs excluded from bug filing."""
-  excluded_jobs = []
+  """Return the set of jobs excluded from bug filing."""
+  excluded_jobs = set()
 
   jobs = ndb_utils.get_all_from_model(data_types.Job)
   for job in jobs:
@@ -126,14 +146,38 @@ def _get_excluded_jobs():
 
     # Exclude experimental jobs.
     if utils.string_is_true(job_environment.get('EXPERIMENTAL')):
-      excluded_jobs.append(job.name)
+      excluded_jobs.add(job.name)
 
     # Exclude custom binary jobs.
     elif (utils.string_is_true(job_environment.get('CUSTOM_BINARY')) or
           job_environment.get('SYSTEM_BINARY_DIR')):
-      excluded_jobs.append(job.name)
+      excluded_jobs.add(job.name)
+
+  return frozenset(excluded_jobs)
 
-  return excluded_jobs
+
+def _iter_testcases_by_keys(keys, batch_size=TESTCASE_FETCH_BATCH_SIZE):
+  """Yield the testcases for the given keys, fetching them in batches."""
+  for i in range(0, len(keys), batch_size):
+    for testcase in ndb.get_multi(keys[i:i + batch_size]):
+      # Skip testcases that were deleted since the key query ran.
+      if testcase:
+        yield testcase
+
+
+def _iter_open_testcase_batches(batch_size=TESTCASE_FETCH_BATCH_SIZE):
+  """Yield lists of open testcases, fetching them from datastore in batches."""
+  testcase_ids = data_handler.get_open_testcase_id_iterator()
+  while True:
+    keys = [
+        ndb.Key(data_types.Testcase, testcase_id)
+        for testcase_id in itertools.islice(testcase_ids, batch_size)
+    ]
+    if not keys:
+      break
+
+    # Skip testcases that were deleted since the id query ran.
+    yield [testcase for testcase in ndb.get_multi(keys) if testcase]
 
 
 def _is_bug_filed(testcase):
@@ -143,12 +187,9 @@ def _is_bug_filed(testcase):
     return True
 
   # Re-check our stored metadata so that we don't file the same testcase twice.
-  is_bug_filed_for_testcase = data_types.FiledBug.query(
-      data_types.FiledBug.testcase_id == testcase.key.id()).get()
-  if is_bug_filed_for_testcase:
-    return True
-
-  return False
+  return data_types.FiledBug.query(
+      data_types.FiledBug.testcase_id == testcase.key.id()).get(
+          keys_only=True) is not None
 
 
 def _is_crash_important(testcase):
@@ -169,10 +210,11 @@ def _is_crash_important(testcase):
 
   # Ensure that there is no reproducible testcase in our group.
   if testcase.group_id:
-    other_reproducible_testcase = data_types.Testcase.query(
+    other_reproducible_testcase_key = data_types.Testcase.query(
         data_types.Testcase.group_id == testcase.group_id,
-        ndb_utils.is_false(data_types.Testcase.one_time_crasher_flag)).get()
-    if other_reproducible_testcase:
+        ndb_utils.is_false(data_types.Testcase.one_time_crasher_flag)).get(
+            keys_only=True)
+    if other_reproducible_testcase_key:
       # There is another reproducible testcase in our group. So, this crash is
       # not important.
       return False
@@ -183,33 +225,12 @@ def _is_crash_important(testcase):
     # No crash stats available, skip.
     return False
 
-  _, rows = crash_stats.get(
+  crash_days_count, total_crash_count = crash_stats.get_crash_days_and_count(
       end=last_hour,
-      block='day',
       days=data_types.FILE_CONSISTENT_UNREPRODUCIBLE_TESTCASE_DEADLINE,
-      group_by='reproducible_flag',
-      where_clause=(
-          'crash_type = %s AND crash_state = %s AND security_flag = %s' %
-          (json.dumps(testcase.crash_type), json.dumps(testcase.crash_state),
-           json.dumps(testcase.security_flag))),
-      group_having_clause='',
-      sort_by='total_count',
-      offset=0,
-      limit=1)
-
-  # Calculate total crash count and crash days count.
-  crash_days_indices = set([])
-  total_crash_count = 0
-  for row in rows:
-    if 'groups' not in row:
-      continue
-
-    total_crash_count += row['totalCount']
-    for group in row['groups']:
-      for index in group['indices']:
-        crash_days_indices.add(index['hour'])
-
-  crash_days_count = len(crash_days_indices)
+      crash_type=testcase.crash_type,
+      crash_state=testcase.crash_state,
+      security_flag=testcase.security_flag)
 
   # Only those unreproducible testcases are important that happened atleast once
   # everyday for the last X days and total crash count exceeded our threshold
@@ -223,12 +244,14 @@ def _is_crash_important(testcase):
 def _check_and_update_similar_bug(testcase, issue_tracker):
   """Get list of similar open issues and ones that were recently closed."""
   # Get similar testcases from the same group.
-  similar_testcases_from_group = []
+  similar_testcase_keys_from_group = []
   if testcase.group_id:
     group_query = data_types.Testcase.query(
         data_types.Testcase.group_id == testcase.group_id)
-    similar_testcases_from_group = ndb_utils.get_all_from_query(
-        group_query, batch_size=data_types.TESTCASE_ENTITY_QUERY_LIMIT // 2)
+    similar_testcase_keys_from_group = ndb_utils.get_all_from_query(
+        group_query,
+        keys_only=True,
+        batch_size=data_types.TESTCASE_ENTITY_QUERY_LIMIT // 2)
 
   # Get testcases with the same crash params. These might not be in the a group
   # if they were just fixed.
@@ -239,21 +262,41 @@ def _check_and_update_similar_bug(testcase, issue_tracker):
       data_types.Testcase.project_name == testcase.project_name,
       data_types.Testcase.status == 'Processed')
 
-  similar_testcases_from_query = ndb_utils.get_all_from_query(
+  similar_testcase_keys_from_query = ndb_utils.get_all_from_query(
       same_crash_params_query,
+      keys_only=True,
       batch_size=data_types.TESTCASE_ENTITY_QUERY_LIMIT // 2)
-  for similar_testcase in itertools.chain(similar_testcases_from_group,
-                                          similar_testcases_from_query):
-    # Exclude ourself from comparison.
-    if similar_testcase.key.id() == testcase.key.id():
-      continue
 
+  # Exclude ourself from comparison, as well as testcases returned by both
+  # queries. Only fetch the full entities if there are any testcases left, which
+  # for most testcases there aren't.
+  similar_testcase_keys = []
+  seen_keys = set([testcase.key])
+  for key in itertools.chain(similar_testcase_keys_from_group,
+                             similar_testcase_keys_from_query):
+    if key not in seen_keys:
+      seen_keys.add(key)
+      similar_testcase_keys.append(key)
+
+  if not similar_testcase_keys:
+    return False
+
+  policy = issue_tracker_policy.get(issue_tracker.project)
+  ignore_label = policy.label('ignore')
+
+  # Many similar testcases usually share the same bug, so only fetch each issue
+  # once.
+  issues = {}
+  for similar_testcase in _iter_testcases_by_keys(similar_testcase_keys):
     # Exclude similar testcases without bug information.
-    if not similar_testcase.bug_information:
+    bug_id = similar_testcase.bug_information
+    if not bug_id:
       continue
 
     # Get the issue object given its ID.
-    issue = issue_tracker.get_issue(similar_testcase.bug_information)
+    if bug_id not in issues:
+      issues[bug_id] = issue_tracker.get_issue(bug_id)
+    issue = issues[bug_id]
     if not issue:
       continue
 
@@ -271,8 +314,6 @@ def _check_and_update_similar_bug(testcase, issue_tracker):
 
     # If the issue indicates that this crash needs to be ignored, no need to
     # file another one.
-    policy = issue_tracker_policy.get(issue_tracker.project)
-    ignore_label = policy.label('ignore')
     if ignore_label in issue.labels:
       _add_triage_message(
           testcase,
@@ -298,6 +339,82 @@ def _check_and_update_similar_bug(testcase, issue_tracker):
   return False
 
 
+def _needs_triage(testcase, excluded_jobs):
+  """Return whether a bug may need to be filed for the testcase. This only
+  reads data, so it is safe to run for several testcases in parallel."""
+  # Skip if testcase's job type is in exclusions list.
+  if testcase.job_type in excluded_jobs:
+    return False
+
+  # Skip if we are running progression task at this time.
+  if testcase.get_metadata('progression_pending'):
+    return False
+
+  # If the testcase has a bug filed already, no triage is needed.
+  if _is_bug_filed(testcase):
+    return False
+
+  # Check if the crash is important, i.e. it is either a reproducible crash
+  # or an unreproducible crash happening frequently.
+  if not _is_crash_important(testcase):
+    return False
+
+  # Require that all tasks like minimizaton, regression testing, etc have
+  # finished.
+  if not data_handler.critical_tasks_completed(testcase):
+    return False
+
+  # For testcases that are not part of a group, wait an additional time till
+  # group task completes.
+  # FIXME: In future, grouping might be dependent on regression range, so we
+  # would have to add an additional wait time.
+  if not testcase.group_id and not dates.time_has_expired(
+      testcase.timestamp, hours=data_types.MIN_ELAPSED_TIME_SINCE_REPORT):
+    return False
+
+  return True
+
+
+def _get_issue_tracker_for_testcase(testcase, issue_trackers):
+  """Get the issue tracker for the testcase, caching it by job type in
+  |issue_trackers|."""
+  if testcase.job_type not in issue_trackers:
+    issue_trackers[testcase.job_type] = (
+        issue_tracker_utils.get_issue_tracker_for_testcase(testcase))
+
+  return issue_trackers[testcase.job_type]
+
+
+def _triage_testcase(testcase, issue_trackers):
+  """File a bug for the testcase if there isn't a similar one already. Issue
+  trackers are cached by job type in |issue_trackers|."""
+  # Re-fetch testcase since triaging an earlier testcase in the same batch might
+  # have updated it, e.g. by associating it with an existing issue.
+  testcase = testcase.key.get()
+  if not testcase or _is_bug_filed(testcase):
+    return
+
+  # If this project does not have an associated issue tracker, we cannot
+  # file this crash anywhere.
+  issue_tracker = _get_issue_tracker_for_testcase(testcase, issue_trackers)
+  if not issue_tracker:
+    return
+
+  # If there are similar issues to this test case already filed or recently
+  # closed, skip filing a duplicate bug.
+  if _check_and_update_similar_bug(testcase, issue_tracker):
+    return
+
+  # Clean up old triage messages that would be not applicable now.
+  testcase.delete_metadata(TRIAGE_MESSAGE_KEY, update_testcase=False)
+
+  # File the bug first and then create filed bug metadata.
+  issue_filer.file_issue(testcase, issue_tracker)
+  _create_filed_bug_metadata(testcase)
+  logs.log('Filed new issue %s for testcase %d.' % (testcase.bug_information,
+                                                    testcase.key.id()))
+
+
 class Handler(base_handler.Handler):
   """Triage testcases."""
 
@@ -315,61 +432,14 @@ class Handler(base_handler.Handler):
 
     # Get list of jobs excluded from bug filing.
     excluded_jobs = _get_excluded_jobs()
-
-    for testcase_id in data_handler.get_open_testcase_id_iterator():
-      try:
-        testcase = data_handler.get_testcase_by_id(testcase_id)
-      except errors.InvalidTestcaseError:
-        # Already deleted.
-        continue
-
-      # Skip if testcase's job type is in exclusions list.
-      if testcase.job_type in excluded_jobs:
-        continue
-
-      # Skip if we are running progression task at this time.
-      if testcase.get_metadata('progression_pending'):
-        continue
-
-      # If the testcase has a bug filed already, no triage is needed.
-      if _is_bug_filed(testcase):
-        continue
-
-      # Check if the crash is important, i.e. it is either a reproducible crash
-      # or an unreproducible crash happening frequently.
-      if not _is_crash_important(testcase):
-        continue
-
-      # Require that all tasks like minimizaton, regression testing, etc have
-      # finished.
-      if not data_handler.critical_tasks_completed(testcase):
-        continue
-
-      # For testcases that are not part of a group, wait an additional time till
-      # group task completes.
-      # FIXME: In future, grouping might be dependent on regression range, so we
-      # would have to add an additional wait time.
-      if not testcase.group_id and not dates.time_has_expired(
-          testcase.timestamp, hours=data_types.MIN_ELAPSED_TIME_SINCE_REPORT):
-        continue
-
-      # If this project does not have an associated issue tracker, we cannot
-      # file this crash anywhere.
-      issue_tracker = issue_tracker_utils.get_issue_tracker_for_testcase(
-          testcase)
-      if not issue_tracker:
-        continue
-
-      # If there are similar issues to this test case already filed or recently
-      # closed, skip filing a duplicate bug.
-      if _check_and_update_similar_bug(testcase, issue_tracker):
-        continue
-
-      # Clean up old triage messages that would be not applicable now.
-      testcase.delete_metadata(TRIAGE_MESSAGE_KEY, update_testcase=False)
-
-      # File the bug first and then create filed bug metadata.
-      issue_filer.file_issue(testcase, issue_tracker)
-      _create_filed_bug_metadata(testcase)
-      logs.log('Filed new issue %s for testcase %d.' %
-               (testcase.bug_information, testcase_id))
+    needs_triage = functools.partial(_needs_triage, excluded_jobs=excluded_jobs)
+    issue_trackers = {}
+
+    with ThreadPoolExecutor(max_workers=TRIAGE_THREADS) as thread_pool:
+      for testcases in _iter_open_testcase_batches():
+        # Only the read-only checks run in parallel. Filing bugs stays
+        # sequential so that similar testcases don't get duplicate bugs.
+        for testcase, triage_needed in zip(
+            testcases, thread_pool.map(needs_triage, testcases)):
+          if triage_needed:
+            _triage_testcase(testcase, issue_trackers)
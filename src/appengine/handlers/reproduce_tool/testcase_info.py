@@ -13,11 +13,22 @@
 # limitations under the License.
 """Handler for serving serialized test cases for the reproduce tool."""
 
+from base import memoize
 from datastore import data_types
 from handlers import base_handler
 from libs import access
 from libs import handler
 
+# Job definitions rarely change, so a short-lived cache is sufficient.
+JOB_DEFINITION_CACHE_TTL = 10 * 60
+
+
+@memoize.wrap(memoize.Memcache(JOB_DEFINITION_CACHE_TTL))
+def _get_job_definition(job_type):
+  """Return the environment string for the given job."""
+  job = data_types.Job.query(data_types.Job.name == job_type).get()
+  return job.get_environment_string()
+
 
 def _prepare_testcase_dict(testcase):
   """Prepare a dictionary containing all information needed by the tool."""
@@ -27,8 +38,7 @@ def _prepare_testcase_dict(testcase):
 
   # The job definition is also required for test case reproduction, so we add
   # it as an additional field.
-  job = data_types.Job.query(data_types.Job.name == testcase.job_type).get()
-  testcase_dict['job_definition'] = job.get_environment_string()
+  testcase_dict['job_definition'] = _get_job_definition(testcase.job_type)
 
   return testcase_dict
 
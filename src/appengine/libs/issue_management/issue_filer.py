@@ -17,6 +17,7 @@ import itertools
 import re
 
 from base import external_users
+from base import memoize
 from base import utils
 from crash_analysis import severity_analyzer
 from datastore import data_handler
@@ -24,7 +25,7 @@ from datastore import data_types
 from libs.issue_management import issue_tracker_policy
 from system import environment
 
-NON_CRASH_TYPES = [
+NON_CRASH_TYPES = frozenset([
     'Data race',
     'Direct-leak',
     'Float-cast-overflow',
@@ -34,43 +35,25 @@ NON_CRASH_TYPES = [
     'RUNTIME_ASSERT',
     'Undefined-shift',
     'Unsigned-integer-overflow',
-]
-
-MEMORY_TOOLS_LABELS = [
-    {
-        'token': 'AddressSanitizer',
-        'label': 'Memory-AddressSanitizer'
-    },
-    {
-        'token': 'LeakSanitizer',
-        'label': 'Memory-LeakSanitizer'
-    },
-    {
-        'token': 'MemorySanitizer',
-        'label': 'Memory-MemorySanitizer'
-    },
-    {
-        'token': 'ThreadSanitizer',
-        'label': 'ThreadSanitizer'
-    },
-    {
-        'token': 'UndefinedBehaviorSanitizer',
-        'label': 'UndefinedBehaviorSanitizer'
-    },
-    {
-        'token': 'afl',
-        'label': 'AFL'
-    },
-    {
-        'token': 'libfuzzer',
-        'label': 'LibFuzzer'
-    },
-]
-
-STACKFRAME_LINE_REGEX = re.compile(r'\s*#\d+\s+0x[0-9A-Fa-f]+\s*')
-
-
-def platform_substitution(label, testcase, _):
+])
+
+# Pairs of (token, label) for memory tools detected in stacktraces.
+MEMORY_TOOLS_LABELS = (
+    ('AddressSanitizer', 'Memory-AddressSanitizer'),
+    ('LeakSanitizer', 'Memory-LeakSanitizer'),
+    ('MemorySanitizer', 'Memory-MemorySanitizer'),
+    ('ThreadSanitizer', 'ThreadSanitizer'),
+    ('UndefinedBehaviorSanitizer', 'UndefinedBehaviorSanitizer'),
+    ('afl', 'AFL'),
+    ('libfuzzer', 'LibFuzzer'),
+)
+
+# Matches whole stack frame lines. [^\S\n] is whitespace other than newlines.
+STACKFRAME_LINE_REGEX = re.compile(
+    r'^[^\S\n]*#\d+[^\S\n]+0x[0-9A-Fa-f]+.*\n?', re.MULTILINE)
+
+
+def platform_substitution(label, testcase, *_):
   """Platform substitution."""
   platform = None
   if environment.is_chromeos_job(testcase.job_type):
@@ -96,10 +79,11 @@ def date_substitution(label, *_):
   return [label.replace('%YYYY-MM-DD%', current_date())]
 
 
-def sanitizer_substitution(label, testcase, _):
+def sanitizer_substitution(label, testcase, _, memory_tool_labels=None):
   """Sanitizer substitution."""
-  stacktrace = data_handler.get_stacktrace(testcase)
-  memory_tool_labels = get_memory_tool_labels(stacktrace)
+  if memory_tool_labels is None:
+    stacktrace = data_handler.get_stacktrace(testcase)
+    memory_tool_labels = get_memory_tool_labels(stacktrace)
 
   return [
       label.replace('%SANITIZER%', memory_tool)
@@ -107,7 +91,7 @@ def sanitizer_substitution(label, testcase, _):
   ]
 
 
-def severity_substitution(label, testcase, security_severity):
+def severity_substitution(label, testcase, security_severity, *_):
   """Severity substitution."""
   # Use severity from testcase if one is not available.
   if security_severity is None:
@@ -122,6 +106,14 @@ def severity_substitution(label, testcase, security_severity):
   return [label.replace('%SEVERITY%', security_severity_string)]
 
 
+LABEL_SUBSTITUTIONS = (
+    ('%PLATFORM%', platform_substitution),
+    ('%YYYY-MM-DD%', date_substitution),
+    ('%SANITIZER%', sanitizer_substitution),
+    ('%SEVERITY%', severity_substitution),
+)
+
+
 def impact_to_string(impact):
   """Convert an impact value to a human-readable string."""
   impact_map = {
@@ -186,30 +178,33 @@ def update_issue_impact_labels(testcase, issue):
   issue.labels.add('Security_Impact-' + impact_to_string(new_impact))
 
 
-def apply_substitutions(policy, label, testcase, security_severity=None):
-  """Apply label substitutions."""
+def apply_substitutions(policy,
+                        label,
+                        testcase,
+                        security_severity=None,
+                        memory_tool_labels=None):
+  """Apply label substitutions. |memory_tool_labels| can be passed in to avoid
+  parsing the stacktrace again for each label."""
   if label is None:
     # If the label is not configured, then nothing to subsitute.
     return []
 
-  label_substitutions = (
-      ('%PLATFORM%', platform_substitution),
-      ('%YYYY-MM-DD%', date_substitution),
-      ('%SANITIZER%', sanitizer_substitution),
-      ('%SEVERITY%', severity_substitution),
-  )
+  if '%' not in label:
+    # Most labels have no markers, so skip checking each one.
+    return [label]
 
-  for marker, handler in label_substitutions:
+  for marker, handler in LABEL_SUBSTITUTIONS:
     if marker in label:
       return [
-          policy.substitution_mapping(label)
-          for label in handler(label, testcase, security_severity)
+          policy.substitution_mapping(label) for label in handler(
+              label, testcase, security_severity, memory_tool_labels)
       ]
 
   # No match found. Return unmodified label.
   return [label]
 
 
+@memoize.wrap(memoize.FifoInMemory(256))
 def get_label_pattern(label):
   """Get the label pattern regex."""
   return re.compile('^' + re.sub(r'%.*?%', r'(.*)', label) + '$', re.IGNORECASE)
@@ -217,15 +212,19 @@ def get_label_pattern(label):
 
 def get_memory_tool_labels(stacktrace):
   """Distinguish memory tools used and return corresponding labels."""
+  # Tokens that do not appear anywhere in the raw stacktrace can't appear once
+  # stack frames are removed either, so skip the filtering when none match.
+  candidates = [(token, label)
+                for token, label in MEMORY_TOOLS_LABELS
+                if token in stacktrace]
+  if not candidates:
+    return []
+
   # Remove stack frames and paths to source code files. This helps to avoid
   # confusion when function names or source paths contain a memory tool token.
-  data = ''
-  for line in stacktrace.split('\n'):
-    if STACKFRAME_LINE_REGEX.match(line):
-      continue
-    data += line + '\n'
+  data = STACKFRAME_LINE_REGEX.sub('', stacktrace)
 
-  labels = [t['label'] for t in MEMORY_TOOLS_LABELS if t['token'] in data]
+  labels = [label for token, label in candidates if token in data]
   return labels
 
 
@@ -259,48 +258,45 @@ def file_issue(testcase,
 
     update_issue_impact_labels(testcase, issue)
 
-  # Add additional labels from the job definition and fuzzer.
-  additional_labels = data_handler.get_additional_values_for_variable(
-      'AUTOMATIC_LABELS', testcase.job_type, testcase.fuzzer_name)
-  for label in additional_labels:
-    issue.labels.add(label)
+  additional_values = data_handler.get_additional_values_for_variables(
+      ['AUTOMATIC_LABELS', 'AUTOMATIC_COMPONENTS', 'AUTOMATIC_CCS'],
+      testcase.job_type, testcase.fuzzer_name)
 
-  # Add additional components from the job definition and fuzzer.
-  automatic_components = data_handler.get_additional_values_for_variable(
-      'AUTOMATIC_COMPONENTS', testcase.job_type, testcase.fuzzer_name)
-  for component in automatic_components:
-    issue.components.add(component)
+  # Add additional labels and components from the job definition and fuzzer.
+  issue.labels.update(additional_values['AUTOMATIC_LABELS'])
+  issue.components.update(additional_values['AUTOMATIC_COMPONENTS'])
 
-  is_crash = not utils.sub_string_exists_in(NON_CRASH_TYPES,
-                                            testcase.crash_type)
+  # Some crash types carry extra details on following lines, e.g. the access
+  # type in 'Data race\nWRITE 4', so only match on the first line.
+  is_crash = testcase.crash_type.split('\n', 1)[0] not in NON_CRASH_TYPES
   properties = policy.get_new_issue_properties(
       is_security=testcase.security_flag, is_crash=is_crash)
 
   issue.status = properties.status
 
-  # Add additional ccs from the job definition and fuzzer.
-  ccs = data_handler.get_additional_values_for_variable(
-      'AUTOMATIC_CCS', testcase.job_type, testcase.fuzzer_name)
-
   # For externally contributed fuzzers, potentially cc the author.
   # Use fully qualified fuzzer name if one is available.
   fully_qualified_fuzzer_name = (
       testcase.overridden_fuzzer_name or testcase.fuzzer_name)
-  ccs += external_users.cc_users_for_fuzzer(fully_qualified_fuzzer_name,
-                                            testcase.security_flag)
-  ccs += external_users.cc_users_for_job(testcase.job_type,
-                                         testcase.security_flag)
-
-  # Add the user as a cc if requested, and any default ccs for this job.
-  # Check for additional ccs or labels from the job definition.
-  if additional_ccs:
-    ccs += [cc for cc in additional_ccs if cc not in ccs]
 
   # For user uploads, we assume the uploader is interested in the issue.
-  if testcase.uploader_email and testcase.uploader_email not in ccs:
-    ccs.append(testcase.uploader_email)
-
-  ccs.extend(properties.ccs)
+  uploader_ccs = [testcase.uploader_email] if testcase.uploader_email else []
+
+  # Combine additional ccs from the job definition and fuzzer, external
+  # contributors, ccs requested by the caller, the uploader, and any default ccs
+  # from the policy, dropping duplicates.
+  ccs = []
+  seen_ccs = set()
+  for cc in itertools.chain(
+      additional_values['AUTOMATIC_CCS'],
+      external_users.cc_users_for_fuzzer(fully_qualified_fuzzer_name,
+                                         testcase.security_flag),
+      external_users.cc_users_for_job(testcase.job_type,
+                                      testcase.security_flag),
+      additional_ccs or [], uploader_ccs, properties.ccs):
+    if cc not in seen_ccs:
+      seen_ccs.add(cc)
+      ccs.append(cc)
 
   # Get view restriction rules for the job.
   issue_restrictions = data_handler.get_value_from_job_definition(
@@ -324,19 +320,27 @@ def file_issue(testcase,
 
   additional_labels.append(policy.label('os'))
 
+  # Parse the stacktrace for memory tool labels at most once, rather than once
+  # per label that needs it.
+  labels_to_substitute = list(
+      itertools.chain(properties.labels, additional_labels))
+  memory_tool_labels = None
+  if any(label and '%SANITIZER%' in label for label in labels_to_substitute):
+    memory_tool_labels = get_memory_tool_labels(
+        data_handler.get_stacktrace(testcase))
+
   # Apply label substitutions.
-  for label in itertools.chain(properties.labels, additional_labels):
-    for result in apply_substitutions(policy, label, testcase,
-                                      security_severity):
-      issue.labels.add(result)
+  for label in labels_to_substitute:
+    issue.labels.update(
+        apply_substitutions(policy, label, testcase, security_severity,
+                            memory_tool_labels))
 
   issue.body += properties.issue_body_footer
   if (should_restrict_issue and has_accountable_people and
       policy.deadline_policy_message):
     issue.body += '\n\n' + policy.deadline_policy_message
 
-  for cc in ccs:
-    issue.ccs.add(cc)
+  issue.ccs.update(ccs)
 
   # Add additional labels from testcase metadata.
   metadata_labels = utils.parse_delimited(
@@ -344,8 +348,7 @@ def file_issue(testcase,
       delimiter=',',
       strip=True,
       remove_empty=True)
-  for label in metadata_labels:
-    issue.labels.add(label)
+  issue.labels.update(metadata_labels)
 
   # TODO(ochang): Add additional components from testcase metadata once ready.
 
@@ -57,6 +57,11 @@ class LabelStore(object):
 
     self._backing[key] = label
 
+  def update(self, labels):
+    """Add multiple labels."""
+    for label in labels:
+      self.add(label)
+
   def remove(self, label):
     """Remove a label."""
     label = str(label)
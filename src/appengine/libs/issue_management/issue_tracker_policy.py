@@ -15,6 +15,7 @@
 from builtins import object
 from collections import namedtuple
 
+from base import memoize
 from config import local_config
 
 Status = namedtuple('Status',
@@ -145,6 +146,7 @@ class IssueTrackerPolicy(object):
     return policy
 
 
+@memoize.wrap(memoize.FifoInMemory(32))
 def get(project_name):
   """Get policy."""
   issue_tracker_config = local_config.IssueTrackerConfig()
@@ -13,20 +13,26 @@
 # limitations under the License.
 """Builtin fuzzers."""
 
-import six
-
 from bot.fuzzers.afl import fuzzer as afl
 from bot.fuzzers.libFuzzer import fuzzer as libFuzzer
 
+# Builtin fuzzer classes, instantiated lazily by get().
 BUILTIN_FUZZERS = {
-    'afl': afl.Afl(),
-    'libFuzzer': libFuzzer.LibFuzzer(),
+    'afl': afl.Afl,
+    'libFuzzer': libFuzzer.LibFuzzer,
 }
 
+# Pairs of (lowercased name, name) for matching builtin fuzzers to job names.
+_LOWERCASE_FUZZER_NAMES = tuple(
+    (fuzzer_name.lower(), fuzzer_name) for fuzzer_name in BUILTIN_FUZZERS)
+
+_builtin_fuzzer_instances = {}
+
 
 def all():  # pylint: disable=redefined-builtin
   """Yield pairs of (name, BuiltinFuzzer)."""
-  return six.iteritems(BUILTIN_FUZZERS)
+  for fuzzer_name in BUILTIN_FUZZERS:
+    yield fuzzer_name, get(fuzzer_name)
 
 
 def get(fuzzer_name):
@@ -34,13 +40,17 @@ def get(fuzzer_name):
   if fuzzer_name not in BUILTIN_FUZZERS:
     return None
 
-  return BUILTIN_FUZZERS[fuzzer_name]
+  if fuzzer_name not in _builtin_fuzzer_instances:
+    _builtin_fuzzer_instances[fuzzer_name] = BUILTIN_FUZZERS[fuzzer_name]()
+
+  return _builtin_fuzzer_instances[fuzzer_name]
 
 
 def get_fuzzer_for_job(job_name):
   """Return a fuzzer override for engine jobs."""
-  for fuzzer_name in BUILTIN_FUZZERS:
-    if fuzzer_name.lower() in job_name.lower():
+  job_name = job_name.lower()
+  for lowercase_fuzzer_name, fuzzer_name in _LOWERCASE_FUZZER_NAMES:
+    if lowercase_fuzzer_name in job_name:
       return fuzzer_name
 
   return None
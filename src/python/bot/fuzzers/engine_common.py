@@ -17,14 +17,16 @@ from __future__ import print_function
 from builtins import object
 from builtins import range
 import contextlib
-import glob
 import os
-import pipes
 import random
+import re
 import shutil
+import six
+import stat
 import sys
 import time
 
+from base import memoize
 from base import utils
 from bot.fuzzers import options
 from bot.fuzzers import utils as fuzzer_utils
@@ -54,9 +56,21 @@ POSTPROCESSING_TIME = 30.0
 # corpus.
 MAX_FILES_FOR_UNPACK = 5
 
+# Buffer size to use when copying seed corpus files out of their archive.
+SEED_CORPUS_COPY_BUFFER_SIZE = 1024 * 1024  # 1 MB.
+
+# Seed corpus files smaller than this are read into memory and written with a
+# single write rather than copied through a file object.
+SEED_CORPUS_SMALL_FILE_SIZE = 64 * 1024  # 64 KB.
+
 # Extension for owners file containing list of people to be notified.
 OWNERS_FILE_EXTENSION = '.owners'
 
+# Matches owners file lines that are owner emails. Comment lines are ignored,
+# as are per-file and file: lines since we don't have a source checkout. Lines
+# without an '@', including '*' (everyone is an owner), are not of any use.
+OWNERS_LINE_REGEX = re.compile(r'(?!#|per-file|file:).*@')
+
 # Extension for per-fuzz target labels to be added to issue tracker.
 LABELS_FILE_EXTENSION = '.labels'
 
@@ -69,13 +83,43 @@ LOG_HEADER_FORMAT = ('Command: {command}\n' 'Bot: {bot}\n' 'Time ran: {time}\n')
 # Number of radamsa mutations.
 RADAMSA_MUTATIONS = 2000
 
-# Maximum number of seconds to run radamsa for.
+# Maximum number of seconds to run radamsa for, per mutation.
 RADAMSA_TIMEOUT = 3
 
+# Number of radamsa mutations to generate in a single radamsa run.
+RADAMSA_MUTATIONS_PER_RUN = 100
+
+# Maximum number of corpus inputs to pass to a single radamsa run.
+RADAMSA_MAX_INPUTS_PER_RUN = 100
+
+# Paths to the radamsa binary for each supported platform.
+_BIN_DIRECTORY_PATH = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), 'bin')
+RADAMSA_PATHS = {
+    'LINUX': os.path.join(_BIN_DIRECTORY_PATH, 'linux', 'radamsa'),
+    'MAC': os.path.join(_BIN_DIRECTORY_PATH, 'mac', 'radamsa'),
+}
+
 # Maximum input size to mutate. This is restricted to avoid adding too many
 # large inputs in the new testcase mutations directory and filing up disk.
 RADAMSA_INPUT_FILE_SIZE_LIMIT = 2 * 1024 * 1024  # 2 Mb.
 
+# Size of the chunks to read when searching for a string in a fuzz target.
+FUZZ_TARGET_SEARCH_CHUNK_SIZE = 1024 * 1024  # 1 MB.
+
+# Random number generator shared by the helpers below, to avoid creating one on
+# each call.
+_system_random = random.SystemRandom()
+
+# Maps the build directory last searched by find_fuzzer_path to an index of
+# file names to paths, so that repeated lookups don't walk the whole build.
+_build_directory_index = {}
+
+# Maps corpus directories to the (archive path, mtime, size, number of files) of
+# the seed corpus last unpacked into them, so that an unchanged seed corpus
+# isn't unpacked again on every fuzzing session.
+_unpacked_seed_corpora = {}
+
 
 class Generator(object):
   """Generators we can use."""
@@ -87,14 +131,15 @@ class Generator(object):
 def select_generator(strategy_pool, fuzzer_path):
   """Pick a generator to generate new testcases before fuzzing or return
   Generator.NONE if no generator selected."""
-  if environment.platform() == 'FUCHSIA':
+  platform = environment.platform()
+  if platform == 'FUCHSIA':
     # Unsupported.
     return Generator.NONE
 
   # We can't use radamsa binary on Windows. Disable ML for now until we know it
   # works on Win.
   # These generators don't produce testcases that LPM fuzzers can use.
-  if (environment.platform() == 'WINDOWS' or is_lpm_fuzz_target(fuzzer_path)):
+  if platform == 'WINDOWS' or is_lpm_fuzz_target(fuzzer_path):
     return Generator.NONE
   elif strategy_pool.do_strategy(strategy.CORPUS_MUTATION_ML_RNN_STRATEGY):
     return Generator.ML_RNN
@@ -114,92 +159,117 @@ def generate_new_testcase_mutations(corpus_directory,
   A false return signifies either no generator use or unsuccessful generation of
   testcase mutations."""
   generation_timeout = get_new_testcase_mutations_timeout()
-  pre_mutations_filecount = shell.get_directory_file_count(
-      new_testcase_mutations_directory)
+  num_new_mutations = 0
 
   # Generate new testcase mutations using Radamsa.
   if candidate_generator == Generator.RADAMSA:
-    generate_new_testcase_mutations_using_radamsa(
+    num_new_mutations = generate_new_testcase_mutations_using_radamsa(
         corpus_directory, new_testcase_mutations_directory, generation_timeout)
   # Generate new testcase mutations using ML RNN model.
   elif candidate_generator == Generator.ML_RNN:
-    generate_new_testcase_mutations_using_ml_rnn(
+    num_new_mutations = generate_new_testcase_mutations_using_ml_rnn(
         corpus_directory, new_testcase_mutations_directory, fuzzer_name,
         generation_timeout)
 
   # If new mutations are successfully generated, return true.
-  if shell.get_directory_file_count(
-      new_testcase_mutations_directory) > pre_mutations_filecount:
-    return True
-
-  return False
+  return bool(num_new_mutations)
 
 
 def generate_new_testcase_mutations_using_radamsa(
     corpus_directory, new_testcase_mutations_directory, generation_timeout):
-  """Generate new testcase mutations based on Radamsa."""
+  """Generate new testcase mutations based on Radamsa. Returns the number of
+  mutations generated."""
   radamsa_path = get_radamsa_path()
   if not radamsa_path:
     # Mutations using radamsa are not supported on current platform, bail out.
-    return
+    return 0
 
   radamsa_runner = new_process.ProcessRunner(radamsa_path)
-  files_list = shell.get_files_list(corpus_directory)
-  filtered_files_list = [
-      f for f in files_list
-      if os.path.getsize(f) <= RADAMSA_INPUT_FILE_SIZE_LIMIT
-  ]
+  filtered_files_list = _get_files_list_with_size_limit(
+      corpus_directory, RADAMSA_INPUT_FILE_SIZE_LIMIT)
   if not filtered_files_list:
     # No mutations to do on an empty corpus or one with very large files.
-    return
+    return 0
 
-  old_corpus_size = shell.get_directory_file_count(
-      new_testcase_mutations_directory)
+  num_mutations = 0
   expected_completion_time = time.time() + generation_timeout
 
-  for i in range(RADAMSA_MUTATIONS):
-    original_file_path = random_choice(filtered_files_list)
-    original_filename = os.path.basename(original_file_path)
-    output_path = os.path.join(new_testcase_mutations_directory,
-                               'radamsa-%08d-%s' % (i + 1, original_filename))
+  # Generate mutations in batches, to avoid spawning a radamsa process for each
+  # mutation. Radamsa picks a random input from the ones given for each output,
+  # and replaces %n in the output pattern with the mutation number.
+  num_runs = RADAMSA_MUTATIONS // RADAMSA_MUTATIONS_PER_RUN
+  num_inputs = min(len(filtered_files_list), RADAMSA_MAX_INPUTS_PER_RUN)
+  for i in range(num_runs):
+    remaining_time = expected_completion_time - time.time()
+    if remaining_time <= 0:
+      # We exceeded our timeout, do no more mutations.
+      break
+
+    input_file_paths = _system_random.sample(filtered_files_list, num_inputs)
+    output_pattern = os.path.join(new_testcase_mutations_directory,
+                                  'radamsa-%08d-%%n' % (i + 1))
 
     result = radamsa_runner.run_and_wait(
-        ['-o', output_path, original_file_path], timeout=RADAMSA_TIMEOUT)
+        ['-n', str(RADAMSA_MUTATIONS_PER_RUN), '-o', output_pattern] +
+        input_file_paths,
+        timeout=min(RADAMSA_TIMEOUT * RADAMSA_MUTATIONS_PER_RUN,
+                    remaining_time))
     if result.return_code or result.timed_out:
       logs.log_error(
           'Radamsa failed to mutate or timed out.', output=result.output)
 
-    # Check if we exceeded our timeout. If yes, do no more mutations and break.
-    if time.time() > expected_completion_time:
-      break
+    # Count the mutations that were actually written, including the ones
+    # written before radamsa failed or timed out.
+    num_mutations += _count_radamsa_outputs(output_pattern)
+
+  logs.log('Added %d tests using Radamsa mutations.' % num_mutations)
+  return num_mutations
 
-  new_corpus_size = shell.get_directory_file_count(
-      new_testcase_mutations_directory)
-  logs.log('Added %d tests using Radamsa mutations.' %
-           (new_corpus_size - old_corpus_size))
+
+def _count_radamsa_outputs(output_pattern):
+  """Returns the number of outputs written by a radamsa run with
+  |output_pattern|. Outputs are numbered from 1, so stop at the first missing
+  one rather than listing the output directory."""
+  output_prefix = output_pattern[:-len('%n')]
+  num_outputs = 0
+  while (num_outputs < RADAMSA_MUTATIONS_PER_RUN and
+         os.path.exists(output_prefix + str(num_outputs + 1))):
+    num_outputs += 1
+
+  return num_outputs
+
+
+def _get_files_list_with_size_limit(directory_path, size_limit):
+  """Returns a list of files in a directory (recursively) that are no larger
+  than |size_limit|. Uses a single stat per file."""
+  files_list = []
+  for root, _, files in os.walk(directory_path):
+    for filename in files:
+      file_path = os.path.join(root, filename)
+      try:
+        file_stat = os.stat(file_path)
+      except OSError:
+        continue
+
+      if stat.S_ISREG(file_stat.st_mode) and file_stat.st_size <= size_limit:
+        files_list.append(file_path)
+
+  return files_list
 
 
 def generate_new_testcase_mutations_using_ml_rnn(
     corpus_directory, new_testcase_mutations_directory, fuzzer_name,
     generation_timeout):
-  """Generate new testcase mutations using ML RNN model."""
-  # No return value for now. Will add later if this is necessary.
-  ml_rnn_generator.execute(corpus_directory, new_testcase_mutations_directory,
-                           fuzzer_name, generation_timeout)
+  """Generate new testcase mutations using ML RNN model. Returns the number of
+  mutations generated."""
+  return ml_rnn_generator.execute(corpus_directory,
+                                  new_testcase_mutations_directory, fuzzer_name,
+                                  generation_timeout)
 
 
 def get_radamsa_path():
   """Return path to radamsa binary for current platform."""
-  bin_directory_path = os.path.join(
-      os.path.dirname(os.path.realpath(__file__)), 'bin')
-  platform = environment.platform()
-  if platform == 'LINUX':
-    return os.path.join(bin_directory_path, 'linux', 'radamsa')
-
-  if platform == 'MAC':
-    return os.path.join(bin_directory_path, 'mac', 'radamsa')
-
-  return None
+  return RADAMSA_PATHS.get(environment.platform())
 
 
 def get_new_testcase_mutations_timeout():
@@ -226,7 +296,7 @@ def get_strategy_probability(strategy_name, default):
 
 def decide_with_probability(probability):
   """Decide if we want to do something with the given probability."""
-  return random.SystemRandom().random() < probability
+  return _system_random.random() < probability
 
 
 def get_testcase_run(stats, fuzzer_command):
@@ -248,6 +318,30 @@ def dump_big_query_data(stats, testcase_file_path, fuzzer_command):
   fuzzer_stats.TestcaseRun.write_to_disk(testcase_run, testcase_file_path)
 
 
+def _index_build_directory(build_directory):
+  """Index all files in |build_directory| by name and cache the result. When a
+  name occurs more than once, the first path found is used."""
+  index = {}
+  for root, _, files in os.walk(build_directory):
+    for filename in files:
+      if filename not in index:
+        index[filename] = os.path.join(root, filename)
+
+  _build_directory_index.clear()
+  _build_directory_index[build_directory] = index
+  return index
+
+
+def _find_in_build_directory_index(index, filenames):
+  """Return the path of the first file in |filenames| found in |index|."""
+  for filename in filenames:
+    file_path = index.get(filename)
+    if file_path and os.path.isfile(file_path):
+      return file_path
+
+  return None
+
+
 def find_fuzzer_path(build_directory, fuzzer_name):
   """Find the fuzzer path with the given name."""
   if environment.platform() == 'FUCHSIA':
@@ -261,12 +355,22 @@ def find_fuzzer_path(build_directory, fuzzer_name):
   if project_name:
     legacy_name_prefix = project_name + '_'
 
-  fuzzer_filename = environment.get_executable_filename(fuzzer_name)
-  for root, _, files in os.walk(build_directory):
-    for filename in files:
-      if (legacy_name_prefix + filename == fuzzer_name or
-          filename == fuzzer_filename):
-        return os.path.join(root, filename)
+  fuzzer_filenames = [environment.get_executable_filename(fuzzer_name)]
+  if fuzzer_name.startswith(legacy_name_prefix):
+    fuzzer_filenames.append(fuzzer_name[len(legacy_name_prefix):])
+
+  fuzzer_path = None
+  index = _build_directory_index.get(build_directory)
+  if index is not None:
+    fuzzer_path = _find_in_build_directory_index(index, fuzzer_filenames)
+
+  if not fuzzer_path:
+    # Either the directory was not indexed yet, or the build changed since.
+    index = _index_build_directory(build_directory)
+    fuzzer_path = _find_in_build_directory_index(index, fuzzer_filenames)
+
+  if fuzzer_path:
+    return fuzzer_path
 
   # This is an expected case when doing regression testing with old builds
   # that do not have that fuzz target. It can also happen when a host sends a
@@ -279,7 +383,7 @@ def find_fuzzer_path(build_directory, fuzzer_name):
 
 def get_command_quoted(command):
   """Return shell quoted command string."""
-  return ' '.join(pipes.quote(part) for part in command)
+  return ' '.join(map(six.moves.shlex_quote, command))
 
 
 def get_overridable_timeout(default_timeout, override_env_var):
@@ -313,8 +417,31 @@ def is_lpm_fuzz_target(fuzzer_path):
   """Returns True if |fuzzer_path| is a libprotobuf-mutator based fuzz
   target."""
   # TODO(metzman): Use this function to disable running LPM targets with AFL.
-  with open(fuzzer_path) as file_handle:
-    return utils.search_string_in_file('TestOneProtoInput', file_handle)
+  # Key the cached result on the file's modification time and size, so that a
+  # target replaced by a new build is searched again.
+  file_stat = os.stat(fuzzer_path)
+  return _search_string_in_fuzz_target(b'TestOneProtoInput', fuzzer_path,
+                                       file_stat.st_mtime, file_stat.st_size)
+
+
+@memoize.wrap(memoize.FifoInMemory(256))
+def _search_string_in_fuzz_target(search_string, fuzzer_path, *_):
+  """Returns True if |search_string| is in the fuzz target at |fuzzer_path|.
+  The file is read in fixed size chunks rather than lines, since binaries can
+  have very long lines."""
+  overlap_size = len(search_string) - 1
+  with open(fuzzer_path, 'rb') as file_handle:
+    previous_chunk_end = b''
+    while True:
+      chunk = file_handle.read(FUZZ_TARGET_SEARCH_CHUNK_SIZE)
+      if not chunk:
+        return False
+
+      # Prepend the end of the previous chunk to find matches spanning chunks.
+      if search_string in previous_chunk_end + chunk:
+        return True
+
+      previous_chunk_end = chunk[-overlap_size:]
 
 
 def get_issue_owners(fuzz_target_path):
@@ -323,58 +450,43 @@ def get_issue_owners(fuzz_target_path):
   Format of an owners file is described at:
   https://cs.chromium.org/chromium/src/third_party/depot_tools/owners.py
   """
-  owners_file_path = fuzzer_utils.get_supporting_file(fuzz_target_path,
-                                                      OWNERS_FILE_EXTENSION)
-
-  if environment.is_trusted_host():
-    owners_file_path = fuzzer_utils.get_file_from_untrusted_worker(
-        owners_file_path)
+  return [
+      line for line in _get_supporting_file_lines(fuzz_target_path,
+                                                  OWNERS_FILE_EXTENSION)
+      if OWNERS_LINE_REGEX.match(line)
+  ]
 
-  if not os.path.exists(owners_file_path):
-    return []
 
-  owners = []
-  with open(owners_file_path, 'r') as owners_file_handle:
-    owners_file_content = owners_file_handle.read()
+def get_issue_metadata(fuzz_target_path, extension):
+  """Get issue metadata."""
+  return list(_get_supporting_file_lines(fuzz_target_path, extension))
 
-    for line in owners_file_content.splitlines():
-      stripped_line = line.strip()
-      if not stripped_line:
-        # Ignore empty lines.
-        continue
-      if stripped_line.startswith('#'):
-        # Ignore comment lines.
-        continue
-      if stripped_line == '*':
-        # Not of any use, we can't add everyone as owner with this.
-        continue
-      if (stripped_line.startswith('per-file') or
-          stripped_line.startswith('file:')):
-        # Don't have a source checkout, so ignore.
-        continue
-      if '@' not in stripped_line:
-        # Bad email address.
-        continue
-      owners.append(stripped_line)
 
-  return owners
+def _get_supporting_file_lines(fuzz_target_path, extension):
+  """Return the stripped, non-empty lines of the supporting file with
+  |extension| for the fuzz target at |fuzz_target_path|."""
+  file_path = fuzzer_utils.get_supporting_file(fuzz_target_path, extension)
 
+  if environment.is_trusted_host():
+    file_path = fuzzer_utils.get_file_from_untrusted_worker(file_path)
 
-def get_issue_metadata(fuzz_target_path, extension):
-  """Get issue metadata."""
-  metadata_file_path = fuzzer_utils.get_supporting_file(fuzz_target_path,
-                                                        extension)
+  if not os.path.exists(file_path):
+    return ()
 
-  if environment.is_trusted_host():
-    metadata_file_path = fuzzer_utils.get_file_from_untrusted_worker(
-        metadata_file_path)
+  # Key the cached result on the file's modification time and size, so that a
+  # file updated by a new build is parsed again.
+  file_stat = os.stat(file_path)
+  return _read_supporting_file_lines(file_path, file_stat.st_mtime,
+                                     file_stat.st_size)
 
-  if not os.path.exists(metadata_file_path):
-    return []
 
-  with open(metadata_file_path) as handle:
-    return utils.parse_delimited(
-        handle, delimiter='\n', strip=True, remove_empty=True)
+@memoize.wrap(memoize.FifoInMemory(256))
+def _read_supporting_file_lines(file_path, *_):
+  """Read and cache the stripped, non-empty lines of |file_path|."""
+  with open(file_path) as handle:
+    return tuple(
+        utils.parse_delimited(
+            handle, delimiter='\n', strip=True, remove_empty=True))
 
 
 def get_issue_labels(fuzz_target_path):
@@ -397,7 +509,7 @@ def format_fuzzing_strategies(fuzzing_strategies):
 
 def random_choice(sequence):
   """Return a random element from the non-empty sequence."""
-  return random.SystemRandom().choice(sequence)
+  return _system_random.choice(sequence)
 
 
 def read_data_from_file(file_path):
@@ -431,9 +543,13 @@ def strip_minijail_command(command, fuzzer_path):
 
 
 def write_data_to_file(content, file_path):
-  """Writes data to file."""
+  """Writes data to file. Binary data is written as is, anything else is
+  written as UTF-8 encoded text."""
+  if not isinstance(content, (bytes, bytearray, memoryview)):
+    content = six.text_type(content).encode('utf-8')
+
   with open(file_path, 'wb') as file_handle:
-    file_handle.write(str(content))
+    file_handle.write(content)
 
 
 class MinijailEngineFuzzerRunner(minijail.MinijailProcessRunner):
@@ -476,14 +592,14 @@ def get_seed_corpus_path(fuzz_target_path):
   Logs an error if multiple seed corpora exist for the same target."""
   archive_path_without_extension = fuzzer_utils.get_supporting_file(
       fuzz_target_path, SEED_CORPUS_ARCHIVE_SUFFIX)
-  # Get all files that end with _seed_corpus.*
-  possible_archive_paths = set(glob.glob(archive_path_without_extension + '.*'))
-  # Now get a list of these that are valid seed corpus archives.
-  archive_paths = possible_archive_paths.intersection(
-      set(archive_path_without_extension + extension
-          for extension in archive.ARCHIVE_FILE_EXTENSIONS))
-
-  archive_paths = list(archive_paths)
+  # Check each valid seed corpus archive extension directly, rather than
+  # listing the whole build directory.
+  archive_paths = []
+  for extension in archive.ARCHIVE_FILE_EXTENSIONS:
+    archive_path = archive_path_without_extension + extension
+    if os.path.exists(archive_path):
+      archive_paths.append(archive_path)
+
   if not archive_paths:
     return None
 
@@ -500,24 +616,47 @@ def process_sanitizer_options_overrides(fuzzer_path):
   if not fuzzer_options:
     return
 
-  asan_options = environment.get_memory_tool_options('ASAN_OPTIONS', {})
-  msan_options = environment.get_memory_tool_options('MSAN_OPTIONS', {})
-  ubsan_options = environment.get_memory_tool_options('UBSAN_OPTIONS', {})
+  # Only look up the current sanitizer options that have overrides.
+  overrides = [
+      ('ASAN_OPTIONS', fuzzer_options.get_asan_options()),
+      ('MSAN_OPTIONS', fuzzer_options.get_msan_options()),
+      ('UBSAN_OPTIONS', fuzzer_options.get_ubsan_options()),
+  ]
+  for options_name, sanitizer_overrides in overrides:
+    if not sanitizer_overrides:
+      continue
 
-  asan_overrides = fuzzer_options.get_asan_options()
-  if asan_options and asan_overrides:
-    asan_options.update(asan_overrides)
-    environment.set_memory_tool_options('ASAN_OPTIONS', asan_options)
+    sanitizer_options = environment.get_memory_tool_options(options_name, {})
+    if sanitizer_options:
+      sanitizer_options.update(sanitizer_overrides)
+      environment.set_memory_tool_options(options_name, sanitizer_options)
 
-  msan_overrides = fuzzer_options.get_msan_options()
-  if msan_options and msan_overrides:
-    msan_options.update(msan_overrides)
-    environment.set_memory_tool_options('MSAN_OPTIONS', msan_options)
 
-  ubsan_overrides = fuzzer_options.get_ubsan_options()
-  if ubsan_options and ubsan_overrides:
-    ubsan_options.update(ubsan_overrides)
-    environment.set_memory_tool_options('UBSAN_OPTIONS', ubsan_options)
+def _write_small_file(file_path, data):
+  """Write |data| to |file_path| using a raw file descriptor, avoiding the cost
+  of creating a buffered file object for each small file."""
+  flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0)
+  fd = os.open(file_path, flags, 0o644)
+  try:
+    while data:
+      data = data[os.write(fd, data):]
+  finally:
+    os.close(fd)
+
+
+def _is_seed_corpus_unpacked(corpus_directory, seed_corpus_stamp):
+  """Return True if the seed corpus identified by |seed_corpus_stamp| was
+  already unpacked into |corpus_directory| and its files are still there."""
+  unpacked_seed_corpus = _unpacked_seed_corpora.get(corpus_directory)
+  if not unpacked_seed_corpus or unpacked_seed_corpus[:-1] != seed_corpus_stamp:
+    return False
+
+  # Files may have been removed since, e.g. by corpus pruning, in which case
+  # the seed corpus needs to be unpacked again.
+  num_unpacked_files = unpacked_seed_corpus[-1]
+  return all(
+      os.path.exists(os.path.join(corpus_directory, '%016d' % idx))
+      for idx in range(num_unpacked_files))
 
 
 def unpack_seed_corpus_if_needed(fuzz_target_path,
@@ -535,6 +674,13 @@ def unpack_seed_corpus_if_needed(fuzz_target_path,
   if not seed_corpus_archive_path:
     return
 
+  archive_stat = os.stat(seed_corpus_archive_path)
+  seed_corpus_stamp = (seed_corpus_archive_path, archive_stat.st_mtime,
+                       archive_stat.st_size)
+  if not force_unpack and _is_seed_corpus_unpacked(corpus_directory,
+                                                   seed_corpus_stamp):
+    return
+
   num_corpus_files = len(shell.get_files_list(corpus_directory))
   if not force_unpack and num_corpus_files > max_files_for_unpack:
     return
@@ -543,25 +689,29 @@ def unpack_seed_corpus_if_needed(fuzz_target_path,
     logs.log('Forced unpack: %s.' % seed_corpus_archive_path)
 
   start_time = time.time()
-  archive_iterator = archive.iterator(seed_corpus_archive_path)
+  # Ignore directories, and allow callers to opt-out of unpacking large files.
+  # Skipped files are filtered out by the iterator without being opened.
+  archive_iterator = archive.iterator(
+      seed_corpus_archive_path,
+      file_match_callback=lambda name: not name.endswith('/'),
+      max_file_size=max_bytes)
   # Unpack seed corpus recursively into the root of the main corpus directory.
   idx = 0
   for seed_corpus_file in archive_iterator:
-    # Ignore directories.
-    if seed_corpus_file.name.endswith('/'):
-      continue
-
-    # Allow callers to opt-out of unpacking large files.
-    if seed_corpus_file.size > max_bytes:
-      continue
-
     output_filename = '%016d' % idx
     output_file_path = os.path.join(corpus_directory, output_filename)
-    with open(output_file_path, 'wb') as file_handle:
-      shutil.copyfileobj(seed_corpus_file.handle, file_handle)
+    if seed_corpus_file.size < SEED_CORPUS_SMALL_FILE_SIZE:
+      _write_small_file(output_file_path, seed_corpus_file.handle.read())
+    else:
+      with open(output_file_path, 'wb') as file_handle:
+        shutil.copyfileobj(seed_corpus_file.handle, file_handle,
+                           SEED_CORPUS_COPY_BUFFER_SIZE)
 
     idx += 1
 
+  if idx:
+    _unpacked_seed_corpora[corpus_directory] = seed_corpus_stamp + (idx,)
+
   logs.log('Unarchiving seed corpus %s took %s seconds.' %
            (seed_corpus_archive_path, time.time() - start_time))
 
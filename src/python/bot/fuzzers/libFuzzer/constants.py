@@ -49,6 +49,10 @@ MERGE_ARGUMENT = '-merge=1'
 
 MINIMIZE_CRASH_ARGUMENT = '-minimize_crash=1'
 
+# Used together with MERGE_ARGUMENT, so that libFuzzer versions without set
+# cover merge support ignore it and fall back to a regular merge.
+SET_COVER_MERGE_ARGUMENT = '-set_cover_merge=1'
+
 PRINT_FINAL_STATS_ARGUMENT = '-print_final_stats=1'
 
 TMP_ARTIFACT_PREFIX_ARGUMENT = ARTIFACT_PREFIX_FLAG + '/tmp/'
@@ -14,7 +14,8 @@
 """libFuzzer engine interface."""
 
 import os
-import re
+import tempfile
+import threading
 
 from bot.fuzzers import dictionary_manager
 from bot.fuzzers import engine
@@ -29,9 +30,29 @@ from bot.fuzzers.libFuzzer import stats
 from fuzzing import strategy
 from metrics import logs
 from metrics import profiler
+from system import environment
 from system import shell
 
 
+# Leftover temporary corpus directories are moved to directories named
+# <name><TRASH_DIRECTORY_INFIX><random suffix> before being deleted.
+TRASH_DIRECTORY_INFIX = '.trash.'
+
+
+def _remove_directories(directory_paths):
+  """Remove |directory_paths|, ignoring errors."""
+  for directory_path in directory_paths:
+    shell.remove_directory(directory_path, ignore_errors=True)
+
+
+def _remove_directories_in_background(directory_paths):
+  """Remove |directory_paths| from a daemon thread."""
+  remove_thread = threading.Thread(
+      target=_remove_directories, args=(directory_paths,))
+  remove_thread.daemon = True
+  remove_thread.start()
+
+
 class LibFuzzerError(Exception):
   """Base libFuzzer error."""
 
@@ -90,7 +111,7 @@ class LibFuzzerEngine(engine.Engine):
 
     if (not strategy_info.use_dataflow_tracing and
         strategy_pool.do_strategy(strategy.CORPUS_SUBSET_STRATEGY) and
-        shell.get_directory_file_count(corpus_dir) > subset_size):
+        shell.directory_has_more_files_than(corpus_dir, subset_size)):
       # Copy |subset_size| testcases into 'subset' directory.
       corpus_subset_dir = self._create_temp_corpus_dir('subset')
       launcher.copy_from_corpus(corpus_subset_dir, corpus_dir, subset_size)
@@ -106,10 +127,10 @@ class LibFuzzerEngine(engine.Engine):
     if dict_argument and not os.path.exists(dict_argument):
       logs.log_error('Invalid dict %s for %s.' % (dict_argument, target_path))
       fuzzer_utils.extract_argument(arguments, constants.DICT_FLAG)
+      dict_argument = None
 
     # If there's no dict argument, check for %target_binary_name%.dict file.
-    if (not fuzzer_utils.extract_argument(
-        arguments, constants.DICT_FLAG, remove=False)):
+    if not dict_argument:
       default_dict_path = dictionary_manager.get_default_dictionary_path(
           target_path)
       if os.path.exists(default_dict_path):
@@ -126,13 +147,44 @@ class LibFuzzerEngine(engine.Engine):
 
   def _create_temp_corpus_dir(self, name):
     """Create temporary corpus directory."""
-    new_corpus_directory = os.path.join(fuzzer_utils.get_temp_dir(), name)
-    engine_common.recreate_directory(new_corpus_directory)
+    temp_dir = fuzzer_utils.get_temp_dir()
+    new_corpus_directory = os.path.join(temp_dir, name)
+    if environment.platform() == 'WINDOWS':
+      engine_common.recreate_directory(new_corpus_directory)
+      return new_corpus_directory
+
+    # Also remove trash directories left behind by earlier calls, e.g. if the
+    # bot exited before they were deleted.
+    trash_prefix = name + TRASH_DIRECTORY_INFIX
+    directories_to_remove = [
+        os.path.join(temp_dir, filename)
+        for filename in os.listdir(temp_dir)
+        if filename.startswith(trash_prefix)
+    ]
+
+    if not os.path.exists(new_corpus_directory):
+      engine_common.recreate_directory(new_corpus_directory)
+    else:
+      # Move the leftover directory out of the way and delete it in the
+      # background, so that deleting a large directory doesn't delay fuzzing.
+      trash_directory = tempfile.mkdtemp(prefix=trash_prefix, dir=temp_dir)
+      directories_to_remove.append(trash_directory)
+      try:
+        os.rename(new_corpus_directory, os.path.join(trash_directory, name))
+      except OSError:
+        # E.g. a mount point, fall back to recreating it in place.
+        engine_common.recreate_directory(new_corpus_directory)
+      else:
+        os.mkdir(new_corpus_directory)
+
+    if directories_to_remove:
+      _remove_directories_in_background(directories_to_remove)
+
     return new_corpus_directory
 
-  def _merge_new_units(self, target_path, corpus_dir, new_corpus_dir,
+  def _merge_new_units(self, runner, corpus_dir, new_corpus_dir,
                        fuzz_corpus_dirs, arguments, stat_overrides):
-    """Merge new units."""
+    """Merge new units, using the |runner| that was used for fuzzing."""
     # Make a decision on whether merge step is needed at all. If there are no
     # new units added by libFuzzer run, then no need to do merge at all.
     new_units_added = shell.get_directory_file_count(new_corpus_dir)
@@ -154,21 +206,19 @@ class LibFuzzerEngine(engine.Engine):
     if corpus_dir not in merge_dirs:
       merge_dirs.append(corpus_dir)
 
-    old_corpus_len = shell.get_directory_file_count(corpus_dir)
-
     new_units_added = 0
     try:
-      result = self.minimize_corpus(
-          target_path=target_path,
+      result = self._minimize_corpus(
+          runner=runner,
           arguments=arguments,
           output_dir=merge_corpus,
           input_dirs=merge_dirs,
           max_time=engine_common.get_merge_timeout(
               launcher.DEFAULT_MERGE_TIMEOUT))
 
-      launcher.move_mergeable_units(merge_corpus, corpus_dir)
-      new_corpus_len = shell.get_directory_file_count(corpus_dir)
-      new_units_added = new_corpus_len - old_corpus_len
+      # Count the units new to the corpus while moving them, rather than
+      # counting the whole corpus before and after.
+      new_units_added = launcher.move_mergeable_units(merge_corpus, corpus_dir)
 
       if result.logs:
         stat_overrides.update(
@@ -209,26 +259,19 @@ class LibFuzzerEngine(engine.Engine):
         additional_args=options.arguments + [artifact_prefix],
         extra_env=options.extra_env)
 
-    log_lines = fuzz_result.output.splitlines()
-    # Output can be large, so save some memory by removing reference to the
-    # original output which is no longer needed.
+    # Keep the original output as the session logs, rather than joining the
+    # split lines back together later. Output can be large, so this avoids
+    # holding a second copy of it.
+    fuzz_logs = fuzz_result.output
     fuzz_result.output = None
+    log_lines = fuzz_logs.splitlines()
 
     # Check if we crashed, and get the crash testcase path.
-    crash_testcase_file_path = None
-    for line in log_lines:
-      match = re.match(launcher.CRASH_TESTCASE_REGEX, line)
-      if match:
-        crash_testcase_file_path = match.group(1)
-        break
+    crash_testcase_file_path = launcher.find_crash_testcase_path(fuzz_logs)
 
-    # Parse stats information based on libFuzzer output.
-    parsed_stats = launcher.parse_log_stats(log_lines)
-
-    # Extend parsed stats by additional performance features.
-    parsed_stats.update(
-        stats.parse_performance_features(log_lines, options.strategies,
-                                         options.arguments))
+    # Parse stats information and performance features from libFuzzer output.
+    parsed_stats = stats.parse_all(log_lines, options.strategies,
+                                   options.arguments)
 
     # Set some initial stat overrides.
     timeout_limit = fuzzer_utils.extract_argument(
@@ -245,13 +288,11 @@ class LibFuzzerEngine(engine.Engine):
     })
 
     # Remove fuzzing arguments before merge and dictionary analysis step.
-    arguments = options.arguments[:]
-    launcher.remove_fuzzing_arguments(arguments)
+    arguments = launcher.filter_fuzzing_arguments(options.arguments)
 
-    self._merge_new_units(target_path, options.corpus_dir, new_corpus_dir,
+    self._merge_new_units(runner, options.corpus_dir, new_corpus_dir,
                           options.fuzz_corpus_dirs, arguments, parsed_stats)
 
-    fuzz_logs = '\n'.join(log_lines)
     crashes = []
     if crash_testcase_file_path:
       # Write the new testcase.
@@ -302,6 +343,16 @@ class LibFuzzerEngine(engine.Engine):
     """
     runner = libfuzzer.get_runner(target_path)
     launcher.set_sanitizer_options(target_path)
+
+    # Set cover merge picks a smaller set of units for the same coverage.
+    arguments = arguments + [constants.SET_COVER_MERGE_ARGUMENT]
+    return self._minimize_corpus(runner, arguments, output_dir, input_dirs,
+                                 max_time)
+
+  def _minimize_corpus(self, runner, arguments, output_dir, input_dirs,
+                       max_time):
+    """Run corpus minimization with an existing |runner|, for which sanitizer
+    options are already set."""
     merge_tmp_dir = self._create_temp_corpus_dir('merge-workdir')
 
     merge_result = runner.merge(
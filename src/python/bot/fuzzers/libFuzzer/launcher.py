@@ -29,7 +29,6 @@ import random
 import re
 import shutil
 import signal
-import string
 import sys
 
 from base import utils
@@ -50,8 +49,11 @@ from system import minijail
 from system import shell
 
 # Regex to find testcase path from a crash.
-CRASH_TESTCASE_REGEX = (r'.*Test unit written to\s*'
-                        r'(.*(crash|oom|timeout|leak)-.*)')
+CRASH_TESTCASE_REGEX = re.compile(r'.*Test unit written to\s*'
+                                  r'(.*(crash|oom|timeout|leak)-.*)')
+
+# Substring that a line must contain to match CRASH_TESTCASE_REGEX.
+CRASH_TESTCASE_MARKER = 'Test unit written to'
 
 # Maximum length of a random chosen length for `-max_len`.
 MAX_VALUE_FOR_MAX_LENGTH = 10000
@@ -79,7 +81,10 @@ ENGINE_ERROR_MESSAGE = 'libFuzzer: engine encountered an error.'
 
 MERGE_DIRECTORY_NAME = 'merge-corpus'
 
-HEXDIGITS_SET = set(string.hexdigits)
+# Random number generator shared across calls, to avoid creating one each time.
+_system_random = random.SystemRandom()
+
+SHA1_HASH_REGEX = re.compile(r'[0-9a-fA-F]{40}\Z')
 
 StrategyInfo = collections.namedtuple('StrategiesInfo', [
     'fuzzing_strategies',
@@ -141,13 +146,9 @@ def add_custom_crash_state_if_needed(fuzzer_name, output_lines, parsed_stats):
   if not parsed_stats['oom_count'] and not parsed_stats['timeout_count']:
     return
 
-  summary_index = None
-
-  for index, line in enumerate(output_lines):
-    if 'SUMMARY:' in line or 'DEATH:' in line:
-      summary_index = index
-      break
-
+  summary_index = next(
+      (index for index, line in enumerate(output_lines)
+       if 'SUMMARY:' in line or 'DEATH:' in line), None)
   if summary_index is not None:
     output_lines.insert(summary_index, 'custom-crash-state: ' + fuzzer_name)
 
@@ -239,25 +240,48 @@ def unbind_corpus_dirs(chroot, corpus_directories):
         minijail.ChrootBinding(corpus_directory, target_dir, True))
 
 
-def create_corpus_directory(name):
+def create_corpus_directory(name, temp_dir=None):
   """Create a corpus directory with a give name in temp directory and return its
   full path."""
-  new_corpus_directory = os.path.join(fuzzer_utils.get_temp_dir(), name)
+  if temp_dir is None:
+    temp_dir = fuzzer_utils.get_temp_dir()
+
+  new_corpus_directory = os.path.join(temp_dir, name)
   engine_common.recreate_directory(new_corpus_directory)
   return new_corpus_directory
 
 
+def _link_or_copy(src_path, dest_path):
+  """Hard link |src_path| to |dest_path|, or copy it if linking is not
+  possible (e.g. across devices, or on platforms without os.link)."""
+  try:
+    os.link(src_path, dest_path)
+  except (AttributeError, OSError):
+    shutil.copy(src_path, dest_path)
+
+
 def copy_from_corpus(dest_corpus_path, src_corpus_path, num_testcases):
   """Choose |num_testcases| testcases from the src corpus directory (and its
   subdirectories) and copy it into the dest directory."""
-  src_corpus_files = []
+  # Reservoir sample the testcases, so that only |num_testcases| paths are kept
+  # in memory rather than a list of the whole corpus.
+  testcases_to_copy = []
+  file_index = 0
   for root, _, files in os.walk(src_corpus_path):
     for f in files:
-      src_corpus_files.append(os.path.join(root, f))
+      if file_index < num_testcases:
+        testcases_to_copy.append(os.path.join(root, f))
+      else:
+        replace_index = _system_random.randint(0, file_index)
+        if replace_index < num_testcases:
+          testcases_to_copy[replace_index] = os.path.join(root, f)
+      file_index += 1
 
   # There is no reason to preserve structure of src_corpus_path directory.
-  for i, to_copy in enumerate(random.sample(src_corpus_files, num_testcases)):
-    shutil.copy(os.path.join(to_copy), os.path.join(dest_corpus_path, str(i)))
+  # Testcases are only read by the fuzzer, so hard link them where possible
+  # rather than copying their contents.
+  for i, to_copy in enumerate(testcases_to_copy):
+    _link_or_copy(to_copy, os.path.join(dest_corpus_path, str(i)))
 
 
 def get_corpus_directories(main_corpus_directory,
@@ -282,7 +306,7 @@ def get_corpus_directories(main_corpus_directory,
 
   if (allow_corpus_subset and
       strategy_pool.do_strategy(strategy.CORPUS_SUBSET_STRATEGY) and
-      shell.get_directory_file_count(main_corpus_directory) > subset_size):
+      shell.directory_has_more_files_than(main_corpus_directory, subset_size)):
     # Copy |subset_size| testcases into 'subset' directory.
     corpus_subset_directory = create_corpus_directory('subset')
     copy_from_corpus(corpus_subset_directory, main_corpus_directory,
@@ -302,16 +326,47 @@ def get_corpus_directories(main_corpus_directory,
   return corpus_directories
 
 
+# Prefixes of arguments that are only meaningful while fuzzing.
+FUZZING_ARGUMENT_PREFIXES = (
+    constants.DICT_FLAG,  # User for fuzzing only.
+    constants.MAX_LEN_FLAG,  # This may shrink the testcases.
+    constants.RUNS_FLAG,  # Make sure we don't have any '-runs' argument.
+    constants.FORK_FLAG,  # It overrides `-merge` argument.
+    constants.COLLECT_DATA_FLOW_FLAG,  # Used for fuzzing only.
+)
+
+
+def filter_fuzzing_arguments(arguments):
+  """Return a copy of arguments without the ones used during fuzzing."""
+  return [
+      argument for argument in arguments
+      if not argument.startswith(FUZZING_ARGUMENT_PREFIXES)
+  ]
+
+
 def remove_fuzzing_arguments(arguments):
   """Remove arguments used during fuzzing."""
-  for argument in [
-      constants.DICT_FLAG,  # User for fuzzing only.
-      constants.MAX_LEN_FLAG,  # This may shrink the testcases.
-      constants.RUNS_FLAG,  # Make sure we don't have any '-runs' argument.
-      constants.FORK_FLAG,  # It overrides `-merge` argument.
-      constants.COLLECT_DATA_FLOW_FLAG,  # Used for fuzzing only.
-  ]:
-    fuzzer_utils.extract_argument(arguments, argument)
+  arguments[:] = filter_fuzzing_arguments(arguments)
+
+
+def find_crash_testcase_path(output):
+  """Return the path of the first crash testcase written according to the
+  libFuzzer |output|, or None. Only lines containing CRASH_TESTCASE_MARKER are
+  matched against CRASH_TESTCASE_REGEX, so the output isn't scanned per line."""
+  marker_index = output.find(CRASH_TESTCASE_MARKER)
+  while marker_index != -1:
+    line_start = output.rfind('\n', 0, marker_index) + 1
+    line_end = output.find('\n', marker_index)
+    if line_end == -1:
+      line_end = len(output)
+
+    match = CRASH_TESTCASE_REGEX.match(output[line_start:line_end].rstrip('\r'))
+    if match:
+      return match.group(1)
+
+    marker_index = output.find(CRASH_TESTCASE_MARKER, line_end)
+
+  return None
 
 
 def load_testcase_if_exists(fuzzer_runner,
@@ -320,8 +375,7 @@ def load_testcase_if_exists(fuzzer_runner,
                             use_minijail=False,
                             additional_args=None):
   """Loads a crash testcase if it exists."""
-  arguments = additional_args[:]
-  remove_fuzzing_arguments(arguments)
+  arguments = filter_fuzzing_arguments(additional_args)
 
   # Add retries for reliability.
   arguments.append('%s%d' % (constants.RUNS_FLAG, constants.RUNS_TO_REPRODUCE))
@@ -342,31 +396,7 @@ def load_testcase_if_exists(fuzzer_runner,
 
 def parse_log_stats(log_lines):
   """Parse libFuzzer log output."""
-  log_stats = {}
-
-  # Parse libFuzzer generated stats (`-print_final_stats=1`).
-  stats_regex = re.compile(r'stat::([A-Za-z_]+):\s*([^\s]+)')
-  for line in log_lines:
-    match = stats_regex.match(line)
-    if not match:
-      continue
-
-    value = match.group(2)
-    if not value.isdigit():
-      # We do not expect any non-numeric stats from libFuzzer, skip those.
-      logs.log_error('Corrupted stats reported by libFuzzer: "%s".' % line)
-      continue
-
-    value = int(value)
-
-    log_stats[match.group(1)] = value
-
-  if log_stats.get('new_units_added') is not None:
-    # 'new_units_added' value will be overwritten after corpus merge step, but
-    # the initial number of units generated is an interesting data as well.
-    log_stats['new_units_generated'] = log_stats['new_units_added']
-
-  return log_stats
+  return stats.parse_log_stats(log_lines)
 
 
 def set_sanitizer_options(fuzzer_path):
@@ -519,24 +549,30 @@ def create_merge_directory():
 
 def is_sha1_hash(possible_hash):
   """Returns True if |possible_hash| looks like a valid sha1 hash."""
-  if len(possible_hash) != 40:
-    return False
-
-  return all(char in HEXDIGITS_SET for char in possible_hash)
+  return bool(SHA1_HASH_REGEX.match(possible_hash))
 
 
 def move_mergeable_units(merge_directory, corpus_directory):
-  """Move new units in |merge_directory| into |corpus_directory|."""
-  initial_units = set(
-      os.path.basename(filename)
-      for filename in shell.get_files_list(corpus_directory))
-
-  for unit_path in shell.get_files_list(merge_directory):
-    unit_name = os.path.basename(unit_path)
-    if unit_name in initial_units and is_sha1_hash(unit_name):
-      continue
-    dest_path = os.path.join(corpus_directory, unit_name)
-    shell.move(unit_path, dest_path)
+  """Move new units in |merge_directory| into |corpus_directory|. Returns the
+  number of units added to |corpus_directory| that it did not already have."""
+  # Only unit names are needed, so take them directly from the walk rather than
+  # building and stat'ing full paths.
+  initial_units = set()
+  for _, _, files in os.walk(corpus_directory):
+    initial_units.update(files)
+
+  new_units_added = 0
+  for root, _, files in os.walk(merge_directory):
+    for unit_name in files:
+      is_new_unit = unit_name not in initial_units
+      if not is_new_unit and is_sha1_hash(unit_name):
+        continue
+      dest_path = os.path.join(corpus_directory, unit_name)
+      shell.move(os.path.join(root, unit_name), dest_path)
+      if is_new_unit:
+        new_units_added += 1
+
+  return new_units_added
 
 
 def pick_strategies(strategy_pool,
@@ -599,7 +635,7 @@ def pick_strategies(strategy_pool,
     max_len_argument = fuzzer_utils.extract_argument(
         existing_arguments, constants.MAX_LEN_FLAG, remove=False)
     if not max_len_argument:
-      max_length = random.SystemRandom().randint(1, MAX_VALUE_FOR_MAX_LENGTH)
+      max_length = _system_random.randint(1, MAX_VALUE_FOR_MAX_LENGTH)
       arguments.append('%s%d' % (constants.MAX_LEN_FLAG, max_length))
       fuzzing_strategies.append(strategy.RANDOM_MAX_LENGTH_STRATEGY.name)
 
@@ -660,12 +696,12 @@ def main(argv):
   signal.signal(signal.SIGTERM, engine_common.signal_term_handler)
 
   # Set up temp dir.
-  engine_common.recreate_directory(fuzzer_utils.get_temp_dir())
+  temp_dir = fuzzer_utils.get_temp_dir()
+  engine_common.recreate_directory(temp_dir)
 
   # Setup minijail if needed.
   use_minijail = environment.get_value('USE_MINIJAIL')
-  runner = libfuzzer.get_runner(
-      fuzzer_path, temp_dir=fuzzer_utils.get_temp_dir())
+  runner = libfuzzer.get_runner(fuzzer_path, temp_dir=temp_dir)
 
   if use_minijail:
     minijail_chroot = runner.chroot
@@ -727,7 +763,7 @@ def main(argv):
       arguments.append(constants.DICT_FLAG + default_dict_path)
 
   # Set up scratch directory for writing new units.
-  new_testcases_directory = create_corpus_directory('new')
+  new_testcases_directory = create_corpus_directory('new', temp_dir=temp_dir)
 
   # Strategy pool is the list of strategies that we attempt to enable, whereas
   # fuzzing strategies is the list of strategies that are enabled. (e.g. if
@@ -785,19 +821,14 @@ def main(argv):
     # itself ran into an error.
     logs.log_error(ENGINE_ERROR_MESSAGE, engine_output=fuzz_result.output)
 
+  # Check if we crashed, and get the crash testcase path.
+  crash_testcase_file_path = find_crash_testcase_path(fuzz_result.output)
+
   log_lines = fuzz_result.output.splitlines()
   # Output can be large, so save some memory by removing reference to the
   # original output which is no longer needed.
   fuzz_result.output = None
 
-  # Check if we crashed, and get the crash testcase path.
-  crash_testcase_file_path = None
-  for line in log_lines:
-    match = re.match(CRASH_TESTCASE_REGEX, line)
-    if match:
-      crash_testcase_file_path = match.group(1)
-      break
-
   if crash_testcase_file_path:
     # Write the new testcase.
     if use_minijail:
@@ -818,13 +849,9 @@ def main(argv):
   print(engine_common.get_log_header(command, bot_name,
                                      fuzz_result.time_executed))
 
-  # Parse stats information based on libFuzzer output.
-  parsed_stats = parse_log_stats(log_lines)
-
-  # Extend parsed stats by additional performance features.
-  parsed_stats.update(
-      stats.parse_performance_features(
-          log_lines, strategy_info.fuzzing_strategies, arguments))
+  # Parse stats information and performance features from libFuzzer output.
+  parsed_stats = stats.parse_all(log_lines, strategy_info.fuzzing_strategies,
+                                 arguments)
 
   # Set some initial stat overrides.
   timeout_limit = fuzzer_utils.extract_argument(
@@ -859,7 +886,7 @@ def main(argv):
 
     merge_tmp_dir = None
     if not use_minijail:
-      merge_tmp_dir = os.path.join(fuzzer_utils.get_temp_dir(), 'merge_workdir')
+      merge_tmp_dir = os.path.join(temp_dir, 'merge_workdir')
       engine_common.recreate_directory(merge_tmp_dir)
 
     old_corpus_len = shell.get_directory_file_count(corpus_directory)
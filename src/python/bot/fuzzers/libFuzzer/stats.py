@@ -56,6 +56,9 @@ LIBFUZZER_MODULES_LOADED_REGEX = re.compile(
     r'^INFO:\s+Loaded\s+\d+\s+(modules|PC tables)\s+\((\d+)\s+.*\).*')
 
 # Regular expressions to extract different values from the log.
+LIBFUZZER_LOG_STAT_PREFIX = 'stat::'
+LIBFUZZER_LOG_STAT_REGEX = re.compile(
+    re.escape(LIBFUZZER_LOG_STAT_PREFIX) + r'([A-Za-z_]+):\s*([^\s]+)')
 LIBFUZZER_LOG_MAX_LEN_REGEX = re.compile(
     r'.*-max_len is not provided; libFuzzer will not generate inputs larger'
     r' than (\d+) bytes.*')
@@ -111,6 +114,41 @@ def calculate_log_lines(log_lines):
   return other_lines_count, libfuzzer_lines_count, ignored_lines_count
 
 
+def _parse_log_stat_line(line, log_stats):
+  """Parse a libFuzzer generated stat line (`-print_final_stats=1`) into
+  |log_stats|."""
+  match = LIBFUZZER_LOG_STAT_REGEX.match(line)
+  if not match:
+    return
+
+  value = match.group(2)
+  if not value.isdigit():
+    # We do not expect any non-numeric stats from libFuzzer, skip those.
+    logs.log_error('Corrupted stats reported by libFuzzer: "%s".' % line)
+    return
+
+  log_stats[match.group(1)] = int(value)
+
+
+def _finalize_log_stats(log_stats):
+  """Add stats derived from the libFuzzer generated ones."""
+  if log_stats.get('new_units_added') is not None:
+    # 'new_units_added' value will be overwritten after corpus merge step, but
+    # the initial number of units generated is an interesting data as well.
+    log_stats['new_units_generated'] = log_stats['new_units_added']
+
+
+def parse_log_stats(log_lines):
+  """Parse libFuzzer generated stats from the log."""
+  log_stats = {}
+  for line in log_lines:
+    if line.startswith(LIBFUZZER_LOG_STAT_PREFIX):
+      _parse_log_stat_line(line, log_stats)
+
+  _finalize_log_stats(log_stats)
+  return log_stats
+
+
 def strategy_column_name(strategy_name):
   """Convert the strategy name into stats column name."""
   return 'strategy_%s' % strategy_name
@@ -153,8 +191,10 @@ def parse_fuzzing_strategies(log_lines, strategies):
   return stats
 
 
-def parse_performance_features(log_lines, strategies, arguments):
-  """Extract stats for performance analysis."""
+def parse_performance_features(log_lines, strategies, arguments,
+                               log_stats=None):
+  """Extract stats for performance analysis. If |log_stats| is provided,
+  libFuzzer generated stats are also parsed into it in the same pass."""
   # Initialize stats with default values.
   stats = {
       'bad_instrumentation': 0,
@@ -213,6 +253,11 @@ def parse_performance_features(log_lines, strategies, arguments):
   has_corpus = False
   libfuzzer_inited = False
   for line in log_lines:
+    if (log_stats is not None and
+        line.startswith(LIBFUZZER_LOG_STAT_PREFIX)):
+      _parse_log_stat_line(line, log_stats)
+      continue
+
     if LIBFUZZER_BAD_INSTRUMENTATION_REGEX.match(line):
       stats['bad_instrumentation'] = 1
       continue
@@ -298,9 +343,22 @@ def parse_performance_features(log_lines, strategies, arguments):
     stats['new_features'] = (
         stats['feature_coverage'] - stats['initial_feature_coverage'])
 
+  if log_stats is not None:
+    _finalize_log_stats(log_stats)
+
   return stats
 
 
+def parse_all(log_lines, strategies, arguments):
+  """Parse both libFuzzer generated stats and performance features from the
+  log in a single pass."""
+  parsed_stats = {}
+  parsed_stats.update(
+      parse_performance_features(
+          log_lines, strategies, arguments, log_stats=parsed_stats))
+  return parsed_stats
+
+
 def parse_stats_from_merge_log(log_lines):
   """Extract stats from a log produced by libFuzzer run with -merge=1."""
   stats = {}
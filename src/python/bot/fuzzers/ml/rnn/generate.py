@@ -131,10 +131,11 @@ def main(args):
               file=sys.stderr)
           return constants.ExitCode.TENSORFLOW_ERROR
 
+        predicted_bytes = utils.sample_batch_from_probabilities(
+            output, topn=TOPN)
         for i in range(BATCH_SIZE):
-          predicted_byte = utils.sample_from_probabilities(output[i], topn=TOPN)
-          new_files_bytes[i].append(predicted_byte)
-          input_bytes[i][0] = predicted_byte
+          new_files_bytes[i].append(predicted_bytes[i])
+        input_bytes[:, 0] = predicted_bytes
 
         # Update state.
         state = new_state
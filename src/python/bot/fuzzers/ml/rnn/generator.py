@@ -191,16 +191,19 @@ def execute(input_directory, output_directory, fuzzer_name, generation_timeout):
         subdirectory in gcs bucket to store models.
     generation_timeout: Time in seconds for the generator to run. Normally it
         takes <1s to generate an input, assuming the input length is <4KB.
+
+  Returns:
+    The number of new inputs generated.
   """
   if environment.platform() != 'LINUX':
     logs.log('Unsupported platform for ML RNN generation, skipping.')
-    return
+    return 0
 
   # Validate corpus folder.
   file_count = shell.get_directory_file_count(input_directory)
   if not file_count:
     logs.log('Corpus is empty. Skip generation.')
-    return
+    return 0
 
   # Number of existing new inputs. They are possibly generated by other
   # generators.
@@ -210,7 +213,7 @@ def execute(input_directory, output_directory, fuzzer_name, generation_timeout):
   # Get model path.
   model_path = prepare_model_directory(fuzzer_name)
   if not model_path:
-    return
+    return 0
 
   result = run(input_directory, output_directory, model_path,
                generation_timeout)
@@ -227,7 +230,9 @@ def execute(input_directory, output_directory, fuzzer_name, generation_timeout):
           'ML RNN generation for fuzzer %s failed with ExitCode = %d.' %
           (fuzzer_name, result.return_code),
           output=result.output)
-    return
+
+    # Inputs written before the failure are still used.
+    return shell.get_directory_file_count(output_directory) - old_corpus_units
 
   # Timeout is not error, if we have new units generated.
   if result.timed_out:
@@ -244,3 +249,5 @@ def execute(input_directory, output_directory, fuzzer_name, generation_timeout):
     logs.log_error(
         'ML RNN generator did not produce any inputs for %s' % fuzzer_name,
         output=result.output)
+
+  return new_corpus_units
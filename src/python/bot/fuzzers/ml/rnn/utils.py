@@ -122,6 +122,35 @@ def sample_from_probabilities(probabilities, topn=constants.ALPHA_SIZE):
   return np.random.choice(constants.ALPHA_SIZE, 1, p=p)[0]
 
 
+def sample_batch_from_probabilities(probabilities,
+                                    topn=constants.ALPHA_SIZE):
+  """Randomly choose one byte for each row of a batch of probabilities.
+
+  Vectorized version of `sample_from_probabilities`, which samples all rows
+  at once rather than calling numpy once per row.
+
+  Args:
+    probabilities: An array of shape [batch_size, ALPHA_SIZE] with individual
+        probabilities for each row.
+    topn: The number of highest probabilities to consider in each row.
+        Defaults to all of them.
+
+  Returns:
+    An array of batch_size random integers.
+  """
+  p = np.array(probabilities, dtype=np.float64)
+  batch_size = p.shape[0]
+  if topn < constants.ALPHA_SIZE:
+    rows = np.arange(batch_size)[:, np.newaxis]
+    p[rows, np.argsort(p, axis=1)[:, :-topn]] = 0
+
+  # Sample by inverting the cumulative distribution of each row.
+  cumulative_p = np.cumsum(p, axis=1)
+  thresholds = np.random.random_sample(batch_size) * cumulative_p[:, -1]
+  choices = np.sum(cumulative_p <= thresholds[:, np.newaxis], axis=1)
+  return np.minimum(choices, constants.ALPHA_SIZE - 1)
+
+
 def rnn_minibatch_sequencer(raw_data, batch_size, sequence_size, nb_epochs):
   """Divide data into batches and return one batch for training each time.
 
@@ -22,6 +22,7 @@ import random
 import re
 import six
 
+from base import memoize
 from bot.fuzzers import utils as fuzzer_utils
 from bot.fuzzers.afl import constants as afl_constants
 from metrics import logs
@@ -168,8 +169,18 @@ def get_fuzz_target_options(fuzz_target_path):
   if not os.path.exists(options_file_path):
     return None
 
+  # Key the cached result on the file's modification time and size, so that an
+  # options file updated by a new build is parsed again.
+  file_stat = os.stat(options_file_path)
   try:
-    return FuzzerOptions(options_file_path, cwd=options_cwd)
+    return _get_fuzzer_options(options_file_path, options_cwd,
+                               file_stat.st_mtime, file_stat.st_size)
   except FuzzerOptionsException:
     logs.log_error('Invalid options file: %s.' % options_file_path)
     return None
+
+
+@memoize.wrap(memoize.FifoInMemory(256))
+def _get_fuzzer_options(options_file_path, options_cwd, *_):
+  """Parse and cache the FuzzerOptions for |options_file_path|."""
+  return FuzzerOptions(options_file_path, cwd=options_cwd)
@@ -1115,18 +1115,42 @@ def get_value_from_job_definition_or_environment(job_type,
 def get_additional_values_for_variable(variable_name, job_type, fuzzer_name):
   """Helper function to read a list of additional items from a job definition
      and fuzzer's additional environment string."""
-  value_list_strings = [
-      get_value_from_job_definition(job_type, variable_name),
-      get_value_from_fuzzer_environment_string(fuzzer_name, variable_name),
-  ]
+  return get_additional_values_for_variables([variable_name], job_type,
+                                             fuzzer_name)[variable_name]
+
+
+def get_additional_values_for_variables(variable_names, job_type, fuzzer_name):
+  """Like get_additional_values_for_variable, but for several variables at once.
+  The job and fuzzer are only fetched once. Returns a dict mapping each variable
+  name to its list of values."""
+  job_environment = {}
+  if job_type:
+    job = data_types.Job.query(data_types.Job.name == job_type).get()
+    if job:
+      job_environment = job.get_environment()
+
+  fuzzer_environment_string = None
+  fuzzer = data_types.Fuzzer.query(data_types.Fuzzer.name == fuzzer_name).get()
+  if fuzzer:
+    fuzzer_environment_string = fuzzer.additional_environment_string
+
+  result = {}
+  for variable_name in variable_names:
+    value_list_strings = [job_environment.get(variable_name)]
+    if fuzzer_environment_string:
+      value_list_strings.append(
+          get_value_from_environment_string(fuzzer_environment_string,
+                                            variable_name))
 
-  additional_values = []
-  for value_list_string in value_list_strings:
-    if value_list_string:
-      # Ignore whitespace between commas.
-      additional_values += [v.strip() for v in value_list_string.split(',')]
+    additional_values = []
+    for value_list_string in value_list_strings:
+      if value_list_string:
+        # Ignore whitespace between commas.
+        additional_values += [v.strip() for v in value_list_string.split(',')]
 
-  return additional_values
+    result[variable_name] = additional_values
+
+  return result
 
 
 # ------------------------------------------------------------------------------
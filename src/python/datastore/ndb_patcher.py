@@ -139,10 +139,11 @@ class Query(object):
     """Wraps fetch()."""
     return list(self.iter(limit=limit, **kwargs))
 
-  def get(self):
+  def get(self, **kwargs):
     """Get a single result from a query."""
+    kwargs['limit'] = 1
     # TODO(ochang): Find a way to fix this more generally.
-    result_func = lambda: next(self.iter(limit=1), None)
+    result_func = lambda: next(self.iter(**kwargs), None)
     return _retry_wrap(result_func)()
 
   def iter(self, **kwargs):
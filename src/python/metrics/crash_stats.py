@@ -110,6 +110,27 @@ GROUP BY
 ORDER BY {sort_by} DESC, total_count DESC
 """
 
+CRASH_DAYS_AND_COUNT_SQL = """
+WITH
+  # Deduplicate rows in case build_crash_stats runs twice on the same hour.
+  uniqueRows AS (
+    SELECT project, hour, MAX(count) AS count
+    FROM main.crash_stats
+    WHERE {where_clause}
+    GROUP BY
+      crash_type, crash_state, security_flag, hour, parent_fuzzer_name,
+      fuzzer_name, job_type, revision, parent_platform, platform, project
+  )
+
+SELECT
+  COUNT(DISTINCT CAST(FLOOR((hour - {remainder}) / 24) AS INT64)) AS crash_days,
+  SUM(count) AS total_count
+FROM uniqueRows
+GROUP BY project
+ORDER BY total_count DESC
+LIMIT 1
+"""
+
 
 def get_remainder_for_index(true_end, time_span):
   """Get remainder. This should be tested together with
@@ -131,9 +152,8 @@ def convert_index_to_hour(index, time_span, remainder):
   return ((index + 1) * time_span) + remainder - 1
 
 
-def get(end, days, block, group_by, where_clause, group_having_clause, sort_by,
-        offset, limit):
-  """Query from BigQuery given the params."""
+def _get_time_range_where_clause(end, days, where_clause):
+  """Restrict |where_clause| to the |days| ending at hour |end|."""
   if where_clause:
     where_clause = '(%s) AND ' % where_clause
 
@@ -144,6 +164,13 @@ def get(end, days, block, group_by, where_clause, group_having_clause, sort_by,
                    'AND TIMESTAMP_TRUNC("%s", DAY))' %
                    (get_datetime(start).strftime('%Y-%m-%d'),
                     get_datetime(end).strftime('%Y-%m-%d')))
+  return where_clause
+
+
+def get(end, days, block, group_by, where_clause, group_having_clause, sort_by,
+        offset, limit):
+  """Query from BigQuery given the params."""
+  where_clause = _get_time_range_where_clause(end, days, where_clause)
 
   time_span = 1 if block == 'hour' else 24
   remainder = get_remainder_for_index(end, time_span)
@@ -199,6 +226,31 @@ def get(end, days, block, group_by, where_clause, group_having_clause, sort_by,
   return result.total_count, items
 
 
+def get_crash_days_and_count(end, days, crash_type, crash_state,
+                             security_flag):
+  """Return the number of days on which a crash occurred and its total crash
+  count over the |days| ending at hour |end|. Only the project with the most
+  crashes is counted."""
+  where_clause = ('crash_type = {crash_type} AND '
+                  'crash_state = {crash_state} AND '
+                  'security_flag = {security_flag}').format(
+                      crash_type=json.dumps(crash_type),
+                      crash_state=json.dumps(crash_state),
+                      security_flag=json.dumps(security_flag))
+  where_clause = _get_time_range_where_clause(end, days, where_clause)
+
+  sql = CRASH_DAYS_AND_COUNT_SQL.format(
+      remainder=get_remainder_for_index(end, 24), where_clause=where_clause)
+
+  client = big_query.Client()
+  result = client.query(query=sql, limit=1)
+  if not result.rows:
+    return 0, 0
+
+  row = result.rows[0]
+  return row['crash_days'], row['total_count']
+
+
 def get_datetime(hours):
   """Get datetime obj from hours from epoch."""
   return datetime.datetime.utcfromtimestamp(hours * 60 * 60)
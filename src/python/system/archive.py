@@ -54,14 +54,22 @@ class ArchiveFile(object):
 def iterator(archive_path,
              archive_obj=None,
              file_match_callback=None,
-             should_extract=True):
+             should_extract=True,
+             max_file_size=None):
   """Return an iterator for files in an archive. Extracts files if
-  |should_extract| is True."""
+  |should_extract| is True. Files larger than |max_file_size| are skipped
+  without being opened."""
   archive_type = get_archive_type(archive_path)
 
   if not file_match_callback:
     file_match_callback = lambda _: True
 
+  def is_match(name, size):
+    """Returns whether a file with |name| and |size| should be yielded."""
+    if max_file_size is not None and size > max_file_size:
+      return False
+    return file_match_callback(name)
+
   def maybe_extract(extract_func, info):
     """Returns an extracted file or None if it is not supposed to be extracted.
     """
@@ -73,7 +81,7 @@ def iterator(archive_path,
     try:
       with zipfile.ZipFile(archive_obj or archive_path) as zip_file:
         for info in zip_file.infolist():
-          if not file_match_callback(info.filename):
+          if not is_match(info.filename, info.file_size):
             continue
 
           yield ArchiveFile(info.filename, info.file_size,
@@ -90,7 +98,7 @@ def iterator(archive_path,
         tar_file = tarfile.open(archive_path)
 
       for info in tar_file.getmembers():
-        if not file_match_callback(info.name):
+        if not is_match(info.name, info.size):
           continue
 
         yield ArchiveFile(info.name, info.size,
@@ -113,7 +121,7 @@ def iterator(archive_path,
 
         error_filepaths = []
         for info in tar_file.getmembers():
-          if not file_match_callback(info.name):
+          if not is_match(info.name, info.size):
             continue
 
           try:
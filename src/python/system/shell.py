@@ -278,6 +278,22 @@ def get_directory_file_count(directory_path):
   return file_count
 
 
+def directory_has_more_files_than(directory_path, max_file_count):
+  """Returns True if a directory (recursively) has more than |max_file_count|
+  files. Stops walking the directory as soon as that is known."""
+  file_count = 0
+  for (root, _, files) in os.walk(directory_path):
+    for filename in files:
+      file_path = os.path.join(root, filename)
+      if not os.path.isfile(file_path):
+        continue
+      file_count += 1
+      if file_count > max_file_count:
+        return True
+
+  return False
+
+
 def get_directory_size(directory_path):
   """Returns size of a directory (in bytes)."""
   directory_size = 0
@@ -22,6 +22,7 @@ import unittest
 import webapp2
 import webtest
 
+from base import memoize
 from base import utils
 from datastore import data_types
 from datastore import ndb
@@ -547,6 +548,8 @@ class OssFuzzProjectSetupTest(unittest.TestCase):
     old_lib_settings = ndb.Key(data_types.OssFuzzProject, 'old_lib').get()
     self.assertIsNone(old_lib_settings)
 
+    # Bucket operations for a project are done in parallel, so their order is
+    # not deterministic.
     mock_storage.buckets().get.assert_has_calls([
         mock.call(bucket='lib1-backup.clusterfuzz-external.appspot.com'),
         mock.call(bucket='lib1-corpus.clusterfuzz-external.appspot.com'),
@@ -560,7 +563,7 @@ class OssFuzzProjectSetupTest(unittest.TestCase):
         mock.call(bucket='lib3-corpus.clusterfuzz-external.appspot.com'),
         mock.call(bucket='lib3-quarantine.clusterfuzz-external.appspot.com'),
         mock.call(bucket='lib3-logs.clusterfuzz-external.appspot.com'),
-    ])
+    ], any_order=True)
 
     mock_storage.buckets().insert.assert_has_calls([
         mock.call(
@@ -703,7 +706,7 @@ class OssFuzzProjectSetupTest(unittest.TestCase):
             },
             project='clusterfuzz-external'),
         mock.call().execute(),
-    ])
+    ], any_order=True)
 
     mock_storage.buckets().setIamPolicy.assert_has_calls([
         mock.call(
@@ -947,62 +950,6 @@ class OssFuzzProjectSetupTest(unittest.TestCase):
                 }]
             },
             bucket='lib1-quarantine.clusterfuzz-external.appspot.com'),
-        mock.call(
-            body={
-                'resourceId':
-                    'fake',
-                'kind':
-                    'storage#policy',
-                'etag':
-                    'fake',
-                'bindings': [{
-                    'role': 'roles/storage.objectViewer',
-                    'members': ['serviceAccount:lib1@serviceaccount.com']
-                }]
-            },
-            bucket='clusterfuzz-external-deployment'),
-        mock.call(
-            body={
-                'resourceId':
-                    'fake',
-                'kind':
-                    'storage#policy',
-                'etag':
-                    'fake',
-                'bindings': [{
-                    'role': 'roles/storage.objectViewer',
-                    'members': ['serviceAccount:lib1@serviceaccount.com']
-                }]
-            },
-            bucket='test-shared-corpus-bucket'),
-        mock.call(
-            body={
-                'resourceId':
-                    'fake',
-                'kind':
-                    'storage#policy',
-                'etag':
-                    'fake',
-                'bindings': [{
-                    'role': 'roles/storage.objectViewer',
-                    'members': ['serviceAccount:lib1@serviceaccount.com']
-                }]
-            },
-            bucket='test-mutator-plugins-bucket'),
-        mock.call(
-            body={
-                'resourceId':
-                    'fake',
-                'kind':
-                    'storage#policy',
-                'etag':
-                    'fake',
-                'bindings': [{
-                    'role': 'roles/storage.objectViewer',
-                    'members': ['serviceAccount:lib1@serviceaccount.com']
-                }]
-            },
-            bucket=u'global-corpus.clusterfuzz-external.appspot.com'),
         mock.call(
             body={
                 'resourceId':
@@ -1059,62 +1006,6 @@ class OssFuzzProjectSetupTest(unittest.TestCase):
                 }]
             },
             bucket='lib2-quarantine.clusterfuzz-external.appspot.com'),
-        mock.call(
-            body={
-                'resourceId':
-                    'fake',
-                'kind':
-                    'storage#policy',
-                'etag':
-                    'fake',
-                'bindings': [{
-                    'role': 'roles/storage.objectViewer',
-                    'members': ['serviceAccount:lib2@serviceaccount.com']
-                }]
-            },
-            bucket='clusterfuzz-external-deployment'),
-        mock.call(
-            body={
-                'resourceId':
-                    'fake',
-                'kind':
-                    'storage#policy',
-                'etag':
-                    'fake',
-                'bindings': [{
-                    'role': 'roles/storage.objectViewer',
-                    'members': ['serviceAccount:lib2@serviceaccount.com']
-                }]
-            },
-            bucket='test-shared-corpus-bucket'),
-        mock.call(
-            body={
-                'resourceId':
-                    'fake',
-                'kind':
-                    'storage#policy',
-                'etag':
-                    'fake',
-                'bindings': [{
-                    'role': 'roles/storage.objectViewer',
-                    'members': ['serviceAccount:lib2@serviceaccount.com']
-                }]
-            },
-            bucket='test-mutator-plugins-bucket'),
-        mock.call(
-            body={
-                'resourceId':
-                    'fake',
-                'kind':
-                    'storage#policy',
-                'etag':
-                    'fake',
-                'bindings': [{
-                    'role': 'roles/storage.objectViewer',
-                    'members': ['serviceAccount:lib2@serviceaccount.com']
-                }]
-            },
-            bucket=u'global-corpus.clusterfuzz-external.appspot.com'),
         mock.call(
             body={
                 'resourceId':
@@ -1234,8 +1125,16 @@ class OssFuzzProjectSetupTest(unittest.TestCase):
                 'etag':
                     'fake',
                 'bindings': [{
-                    'role': 'roles/storage.objectViewer',
-                    'members': ['serviceAccount:lib3@serviceaccount.com']
+                    'role':
+                        'roles/storage.objectViewer',
+                    'members': [
+                        'serviceAccount:lib1@serviceaccount.com',
+                        'serviceAccount:lib2@serviceaccount.com',
+                        'serviceAccount:lib3@serviceaccount.com',
+                        'serviceAccount:lib4@serviceaccount.com',
+                        'serviceAccount:lib5@serviceaccount.com',
+                        'serviceAccount:lib6@serviceaccount.com',
+                    ]
                 }]
             },
             bucket='clusterfuzz-external-deployment'),
@@ -1248,8 +1147,16 @@ class OssFuzzProjectSetupTest(unittest.TestCase):
                 'etag':
                     'fake',
                 'bindings': [{
-                    'role': 'roles/storage.objectViewer',
-                    'members': ['serviceAccount:lib3@serviceaccount.com']
+                    'role':
+                        'roles/storage.objectViewer',
+                    'members': [
+                        'serviceAccount:lib1@serviceaccount.com',
+                        'serviceAccount:lib2@serviceaccount.com',
+                        'serviceAccount:lib3@serviceaccount.com',
+                        'serviceAccount:lib4@serviceaccount.com',
+                        'serviceAccount:lib5@serviceaccount.com',
+                        'serviceAccount:lib6@serviceaccount.com',
+                    ]
                 }]
             },
             bucket='test-shared-corpus-bucket'),
@@ -1262,8 +1169,16 @@ class OssFuzzProjectSetupTest(unittest.TestCase):
                 'etag':
                     'fake',
                 'bindings': [{
-                    'role': 'roles/storage.objectViewer',
-                    'members': ['serviceAccount:lib3@serviceaccount.com']
+                    'role':
+                        'roles/storage.objectViewer',
+                    'members': [
+                        'serviceAccount:lib1@serviceaccount.com',
+                        'serviceAccount:lib2@serviceaccount.com',
+                        'serviceAccount:lib3@serviceaccount.com',
+                        'serviceAccount:lib4@serviceaccount.com',
+                        'serviceAccount:lib5@serviceaccount.com',
+                        'serviceAccount:lib6@serviceaccount.com',
+                    ]
                 }]
             },
             bucket='test-mutator-plugins-bucket'),
@@ -1276,12 +1191,20 @@ class OssFuzzProjectSetupTest(unittest.TestCase):
                 'etag':
                     'fake',
                 'bindings': [{
-                    'role': 'roles/storage.objectViewer',
-                    'members': ['serviceAccount:lib3@serviceaccount.com']
+                    'role':
+                        'roles/storage.objectViewer',
+                    'members': [
+                        'serviceAccount:lib1@serviceaccount.com',
+                        'serviceAccount:lib2@serviceaccount.com',
+                        'serviceAccount:lib3@serviceaccount.com',
+                        'serviceAccount:lib4@serviceaccount.com',
+                        'serviceAccount:lib5@serviceaccount.com',
+                        'serviceAccount:lib6@serviceaccount.com',
+                    ]
                 }]
             },
-            bucket=u'global-corpus.clusterfuzz-external.appspot.com')
-    ])
+            bucket=u'global-corpus.clusterfuzz-external.appspot.com'),
+    ], any_order=True)
 
     mappings = data_types.FuzzerJob.query()
     tags_fuzzers_and_jobs = [(m.platform, m.fuzzer, m.job) for m in mappings]
@@ -1452,9 +1375,11 @@ def mock_get_url(url):
 
 
 class MockRequestsGet(object):
-  """Mock requests.get."""
+  """Mock requests.Session.get."""
 
-  def __init__(self, url, params):  # pylint: disable=unused-argument
+  # pylint: disable=unused-argument
+  def __init__(self, session, url, params, headers):
+    self.headers = {}
     if url in URL_RESULTS:
       self.text = URL_RESULTS[url]
       self.status_code = 200
@@ -1463,6 +1388,116 @@ class MockRequestsGet(object):
       self.status_code = 500
 
 
+@test_utils.with_cloud_emulators('datastore')
+class ProjectSetupTest(unittest.TestCase):
+  """Test ProjectSetup."""
+
+  def setUp(self):
+    helpers.patch(self, [
+        'base.utils.get_application_id',
+        'config.local_config.ProjectConfig',
+    ])
+    self.mock.get_application_id.return_value = 'clusterfuzz-external'
+    self.mock.ProjectConfig.return_value = mock_config.MockConfig({})
+
+    self.afl = data_types.Fuzzer(name='afl', jobs=[])
+    self.afl.put()
+    self.libfuzzer = data_types.Fuzzer(name='libFuzzer', jobs=[])
+    self.libfuzzer.put()
+
+    self.project_setup = project_setup.ProjectSetup(
+        project_setup.BUILD_BUCKET_PATH_TEMPLATE,
+        project_setup.REVISION_URL,
+        'RELEASE_BUILD_BUCKET_PATH',
+        engine_build_buckets={
+            'afl': 'clusterfuzz-builds-afl',
+            'libfuzzer': 'clusterfuzz-builds',
+        },
+        fuzzer_entities={
+            'afl': self.afl,
+            'libfuzzer': self.libfuzzer,
+        })
+
+  def test_dataflow_without_libfuzzer_job(self):
+    """Tests that the dataflow build bucket is not required for projects
+    without libFuzzer x86_64 jobs."""
+    # pylint: disable=protected-access
+    jobs, jobs_to_enable = self.project_setup._sync_job(
+        'lib', {
+            'fuzzing_engines': ['afl', 'dataflow'],
+            'sanitizers': ['address'],
+        }, {}, None, None, None, None)
+
+    self.assertEqual(['afl_asan_lib'], [job.name for job in jobs])
+    self.assertEqual([('afl', 'afl_asan_lib')], jobs_to_enable)
+    self.assertNotIn('DATAFLOW_BUILD_BUCKET_PATH', jobs[0].environment_string)
+
+  def test_set_up_with_failed_project(self):
+    """Tests that the jobs of other projects are still saved and enabled when
+    setting up a project fails."""
+    with self.assertRaises(project_setup.ProjectSetupError):
+      # There is no i386 libFuzzer build bucket, so setting up lib1 fails.
+      self.project_setup.set_up([
+          ('lib1', {
+              'architectures': ['i386'],
+              'fuzzing_engines': ['libfuzzer'],
+              'sanitizers': ['address'],
+          }),
+          ('lib2', {
+              'fuzzing_engines': ['libfuzzer'],
+              'sanitizers': ['address'],
+          }),
+      ])
+
+    self.assertEqual(['libfuzzer_asan_lib2'],
+                     [job.name for job in data_types.Job.query()])
+    libfuzzer = data_types.Fuzzer.query(
+        data_types.Fuzzer.name == 'libFuzzer').get()
+    self.assertEqual(['libfuzzer_asan_lib2'], libfuzzer.jobs)
+
+
+class GetGithubUrlTest(unittest.TestCase):
+  """Test get_github_url()."""
+
+  def setUp(self):
+    helpers.patch(self, ['requests.Session.get'])
+
+    patcher = mock.patch('handlers.cron.project_setup._github_cache',
+                         memoize.FifoInMemory(10))
+    self.addCleanup(patcher.stop)
+    patcher.start()
+
+  def test_revalidate_with_etag(self):
+    """Tests that the ETag of a response is stored, and that the cached body is
+    returned when GitHub replies that it is unchanged."""
+    url = 'https://api.github.com/repos/google/oss-fuzz/contents/projects'
+    credentials = ('client_id', 'client_secret')
+    self.mock.get.side_effect = [
+        mock.Mock(status_code=200, text='{"a": 1}', headers={'ETag': '"abc"'}),
+        mock.Mock(status_code=304, text='', headers={}),
+    ]
+
+    self.assertEqual({'a': 1}, project_setup.get_github_url(url, credentials))
+    self.mock.get.assert_called_with(
+        mock.ANY,
+        url,
+        params={
+            'client_id': 'client_id',
+            'client_secret': 'client_secret'
+        },
+        headers={})
+
+    self.assertEqual({'a': 1}, project_setup.get_github_url(url, credentials))
+    self.mock.get.assert_called_with(
+        mock.ANY,
+        url,
+        params={
+            'client_id': 'client_id',
+            'client_secret': 'client_secret'
+        },
+        headers={'If-None-Match': '"abc"'})
+
+
 @test_utils.with_cloud_emulators('datastore')
 class GetLibrariesTest(unittest.TestCase):
   """Test get_oss_fuzz_projects()."""
@@ -1470,7 +1505,7 @@ class GetLibrariesTest(unittest.TestCase):
   def setUp(self):
     data_types.Config(github_credentials='client_id;client_secret').put()
 
-    helpers.patch(self, ['requests.get'])
+    helpers.patch(self, ['requests.Session.get'])
     self.mock.get.side_effect = MockRequestsGet
 
   def test_get_oss_fuzz_projects(self):
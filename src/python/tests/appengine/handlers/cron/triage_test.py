@@ -14,10 +14,12 @@
 # pylint: disable=protected-access
 """Tests for triage task."""
 
-from builtins import range
 import datetime
 import unittest
 
+import webapp2
+import webtest
+
 from datastore import data_handler
 from datastore import data_types
 from handlers.cron import triage
@@ -33,7 +35,7 @@ class CrashImportantTest(unittest.TestCase):
   def setUp(self):
     helpers.patch(self, [
         'metrics.crash_stats.get_last_successful_hour',
-        'metrics.crash_stats.get',
+        'metrics.crash_stats.get_crash_days_and_count',
         'base.utils.utcnow',
     ])
     self.mock.utcnow.return_value = test_utils.CURRENT_TIME
@@ -96,17 +98,7 @@ class CrashImportantTest(unittest.TestCase):
     """If this unreproducible testcase is less than the total crash threshold,
     then it is not important."""
     self.mock.get_last_successful_hour.return_value = 417325
-    indices = [{
-        'count': 1,
-        'hour': day_index
-    } for day_index in range(417325, 416989, -24)]
-    self.mock.get.return_value = (1, [{
-        'totalCount': 14,
-        'groups': [{
-            'indices': indices,
-            'name': 'false',
-        },]
-    }])
+    self.mock.get_crash_days_and_count.return_value = (14, 14)
     testcase = test_utils.create_generic_testcase()
     testcase.one_time_crasher_flag = True
     testcase.put()
@@ -117,17 +109,7 @@ class CrashImportantTest(unittest.TestCase):
     """If this unreproducible testcase spiked only for a certain interval, then
     it is not important."""
     self.mock.get_last_successful_hour.return_value = 417325
-    self.mock.get.return_value = (1, [{
-        'totalCount':
-            125,
-        'groups': [{
-            'indices': [{
-                'count': 125,
-                'hour': 417301,
-            }],
-            'name': 'false',
-        },]
-    }])
+    self.mock.get_crash_days_and_count.return_value = (1, 125)
     testcase = test_utils.create_generic_testcase()
     testcase.one_time_crasher_flag = True
     testcase.put()
@@ -138,17 +120,7 @@ class CrashImportantTest(unittest.TestCase):
     """If this unreproducible testcase is crashing frequently, then it is an
     important crash."""
     self.mock.get_last_successful_hour.return_value = 417325
-    indices = [{
-        'count': 10,
-        'hour': day_index
-    } for day_index in range(417325, 416989, -24)]
-    self.mock.get.return_value = (1, [{
-        'totalCount': 140,
-        'groups': [{
-            'indices': indices,
-            'name': 'false',
-        },]
-    }])
+    self.mock.get_crash_days_and_count.return_value = (14, 140)
     testcase = test_utils.create_generic_testcase()
     testcase.one_time_crasher_flag = True
     testcase.put()
@@ -159,17 +131,7 @@ class CrashImportantTest(unittest.TestCase):
     """If this unreproducible testcase is crashing frequently, but its crash
     type is one of crash type ignores, then it is not an important crash."""
     self.mock.get_last_successful_hour.return_value = 417325
-    indices = [{
-        'count': 10,
-        'hour': day_index
-    } for day_index in range(417325, 416989, -24)]
-    self.mock.get.return_value = (1, [{
-        'totalCount': 140,
-        'groups': [{
-            'indices': indices,
-            'name': 'false',
-        },]
-    }])
+    self.mock.get_crash_days_and_count.return_value = (14, 140)
     testcase = test_utils.create_generic_testcase()
     testcase.one_time_crasher_flag = True
     testcase.put()
@@ -366,3 +328,86 @@ class CheckAndUpdateSimilarBug(unittest.TestCase):
     self.assertEqual(
         'Delaying filing a bug since similar testcase (2) in issue (1) '
         'was just fixed.', testcase.get_metadata(triage.TRIAGE_MESSAGE_KEY))
+
+
+@test_utils.with_cloud_emulators('datastore')
+class TriageHandlerTest(unittest.TestCase):
+  """Tests for the triage handler."""
+
+  def setUp(self):
+    helpers.patch(self, [
+        'base.utils.utcnow',
+        'datastore.data_handler.critical_tasks_completed',
+        'datastore.data_handler.get_open_testcase_id_iterator',
+        'handlers.base_handler.Handler.is_cron',
+        'handlers.cron.grouper.group_testcases',
+        'handlers.cron.triage._get_excluded_jobs',
+        'libs.issue_management.issue_filer.file_issue',
+        'libs.issue_management.issue_tracker_utils.'
+        'get_issue_tracker_for_testcase',
+    ])
+    self.mock.utcnow.return_value = test_utils.CURRENT_TIME
+    self.mock.critical_tasks_completed.return_value = True
+    self.mock._get_excluded_jobs.return_value = frozenset()
+    self.mock.file_issue.side_effect = self._file_issue
+    self.mock.get_issue_tracker_for_testcase.return_value = (
+        appengine_test_utils.create_generic_issue().issue_tracker)
+
+    self.app = webtest.TestApp(
+        webapp2.WSGIApplication([('/triage', triage.Handler)]))
+    self.filed_testcase_ids = []
+
+  def _file_issue(self, testcase, _):
+    """Mock file_issue. Like grouping would, also associates the other
+    testcases in the group with the new issue."""
+    self.filed_testcase_ids.append(testcase.key.id())
+    testcase.bug_information = str(len(self.filed_testcase_ids))
+    testcase.put()
+
+    if not testcase.group_id:
+      return
+
+    for other_testcase in data_types.Testcase.query(
+        data_types.Testcase.group_id == testcase.group_id):
+      if other_testcase.key != testcase.key:
+        other_testcase.bug_information = testcase.bug_information
+        other_testcase.put()
+
+  def _set_open_testcases(self, testcases):
+    self.mock.get_open_testcase_id_iterator.return_value = iter(
+        [testcase.key.id() for testcase in testcases])
+
+  def test_deleted_testcase(self):
+    """Tests that a testcase deleted after the open testcase ids were queried
+    is skipped, and the rest of its batch is still triaged."""
+    testcase_1 = test_utils.create_generic_testcase()
+    testcase_1.crash_state = 'crash_1'
+    testcase_1.put()
+    deleted_testcase = test_utils.create_generic_testcase()
+    testcase_2 = test_utils.create_generic_testcase()
+    testcase_2.crash_state = 'crash_2'
+    testcase_2.put()
+
+    self._set_open_testcases([testcase_1, deleted_testcase, testcase_2])
+    deleted_testcase.key.delete()
+
+    self.app.get('/triage')
+    self.assertEqual([testcase_1.key.id(), testcase_2.key.id()],
+                     self.filed_testcase_ids)
+
+  def test_testcase_associated_earlier_in_batch(self):
+    """Tests that a testcase associated with an issue while triaging an
+    earlier testcase in the same batch doesn't get another issue filed."""
+    testcase_1 = test_utils.create_generic_testcase()
+    testcase_1.group_id = 1
+    testcase_1.put()
+    testcase_2 = test_utils.create_generic_testcase()
+    testcase_2.group_id = 1
+    testcase_2.put()
+
+    self._set_open_testcases([testcase_1, testcase_2])
+
+    self.app.get('/triage')
+    self.assertEqual([testcase_1.key.id()], self.filed_testcase_ids)
+    testcase_2 = data_handler.get_testcase_by_id(testcase_2.key.id())
+    self.assertEqual('1', testcase_2.bug_information)
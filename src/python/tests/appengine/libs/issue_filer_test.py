@@ -450,13 +450,13 @@ class IssueFilerTests(unittest.TestCase):
   def test_memory_tool_used(self, project_name, policy):
     """Test memory tool label is correctly set."""
     self.mock.get.return_value = policy
-    for entry in issue_filer.MEMORY_TOOLS_LABELS:
+    for token, label in issue_filer.MEMORY_TOOLS_LABELS:
       issue_tracker = monorail.IssueTracker(IssueTrackerManager(project_name))
 
-      self.testcase1.crash_stacktrace = '\n\n%s\n' % entry['token']
+      self.testcase1.crash_stacktrace = '\n\n%s\n' % token
       self.testcase1.put()
       issue_filer.file_issue(self.testcase1, issue_tracker)
-      self.assertIn('Stability-' + entry['label'],
+      self.assertIn('Stability-' + label,
                     issue_tracker._itm.last_issue.labels)
 
   def test_reproducible_flag(self):
@@ -48,6 +48,14 @@ class LabelStoreTest(unittest.TestCase):
     self.assertItemsEqual(['laBel1', 'labEl2'], store.added)
     self.assertItemsEqual([], store.removed)
 
+  def test_update(self):
+    """Test adding multiple items."""
+    store = LabelStore(['label1'])
+    store.update(['Label1', 'label2', '', 'LABEL2'])
+    self.assertItemsEqual(['Label1', 'LABEL2'], store)
+    self.assertItemsEqual(['Label1', 'LABEL2'], store.added)
+    self.assertItemsEqual([], store.removed)
+
   def test_remove(self):
     """Test removing items."""
     store = LabelStore(['laBel1', 'label2', 'Label3'])
@@ -14,6 +14,7 @@
 """Tests fuzzers.engine_common."""
 
 from builtins import range
+import mock
 import os
 import parameterized
 import six
@@ -22,7 +23,10 @@ import unittest
 from pyfakefs import fake_filesystem_unittest
 
 from bot.fuzzers import engine_common
+from bot.fuzzers.ml.rnn import constants as ml_rnn_constants
+from system import archive
 from system import environment
+from system import new_process
 from tests.test_libs import helpers as test_helpers
 from tests.test_libs import test_utils
 
@@ -254,6 +258,186 @@ class FindFuzzerPathTest(fake_filesystem_unittest.TestCase):
     self.fs.create_dir(os.path.join(self.build_dir, self.fuzzer_name))
     self.assertIsNone(self._find_fuzzer_path())
 
+  def test_finds_fuzzer_added_after_indexing(self):
+    """Test that a fuzzer added after the build directory was indexed is
+    found."""
+    self.assertIsNone(self._find_fuzzer_path())
+    self.assertEqual(self._setup_fuzzer(), self._find_fuzzer_path())
+
+  def test_finds_fuzzer_in_subdirectory(self):
+    """Test finding a fuzzer in a subdirectory of the build directory."""
+    self._setup_fuzzer('other_fuzz_target')
+    self.assertEqual(
+        self._setup_fuzzer(os.path.join('subdir', self.fuzzer_name)),
+        self._find_fuzzer_path())
+
+
+class IsLpmFuzzTargetTest(fake_filesystem_unittest.TestCase):
+  """is_lpm_fuzz_target tests."""
+
+  def setUp(self):
+    test_utils.set_up_pyfakefs(self)
+    self.fs.create_dir('/test')
+
+  def test_lpm_fuzz_target(self):
+    """Test that an LPM fuzz target is detected."""
+    self.fs.create_file(
+        '/test/lpm_fuzz_target', contents=b'\x00\x01TestOneProtoInput\x02')
+    self.assertTrue(engine_common.is_lpm_fuzz_target('/test/lpm_fuzz_target'))
+
+  def test_not_lpm_fuzz_target(self):
+    """Test that a regular fuzz target is not detected as LPM."""
+    self.fs.create_file(
+        '/test/fuzz_target', contents=b'\x00\x01LLVMFuzzerTestOneInput\x02')
+    self.assertFalse(engine_common.is_lpm_fuzz_target('/test/fuzz_target'))
+
+  @mock.patch('bot.fuzzers.engine_common.FUZZ_TARGET_SEARCH_CHUNK_SIZE', 8)
+  def test_match_across_chunks(self):
+    """Test that a match spanning two read chunks is found."""
+    self.fs.create_file(
+        '/test/chunked_fuzz_target',
+        contents=b'\x00' * 5 + b'TestOneProtoInput')
+    self.assertTrue(
+        engine_common.is_lpm_fuzz_target('/test/chunked_fuzz_target'))
+
+
+class GenerateNewTestcaseMutationsUsingRadamsaTest(
+    fake_filesystem_unittest.TestCase):
+  """generate_new_testcase_mutations_using_radamsa tests."""
+
+  def setUp(self):
+    test_utils.set_up_pyfakefs(self)
+    test_helpers.patch(self, [
+        'bot.fuzzers.engine_common.get_radamsa_path',
+        'metrics.logs.log_error',
+        'system.new_process.ProcessRunner.run_and_wait',
+    ])
+    self.mock.get_radamsa_path.return_value = '/radamsa'
+
+    self.fs.create_file('/corpus/a', contents='a')
+    self.fs.create_file('/corpus/b', contents='b')
+    self.fs.create_dir('/mutations')
+
+  def _mock_radamsa_runs(self, runs):
+    """Makes radamsa runs write outputs as given by |runs|, a list of
+    (number of outputs, return code) tuples, one per run."""
+    runs = list(runs)
+
+    def run_and_wait(_, args, timeout):
+      """Mock run_and_wait."""
+      num_outputs, return_code = runs.pop(0)
+      output_pattern = args[args.index('-o') + 1]
+      for i in range(num_outputs):
+        self.fs.create_file(output_pattern.replace('%n', str(i + 1)))
+
+      return new_process.ProcessResult(
+          command=args,
+          return_code=return_code,
+          output='',
+          time_executed=timeout,
+          timed_out=False)
+
+    self.mock.run_and_wait.side_effect = run_and_wait
+
+  def _generate(self, generation_timeout=600):
+    return engine_common.generate_new_testcase_mutations_using_radamsa(
+        '/corpus', '/mutations', generation_timeout)
+
+  @mock.patch('bot.fuzzers.engine_common.RADAMSA_MUTATIONS', 6)
+  @mock.patch('bot.fuzzers.engine_common.RADAMSA_MUTATIONS_PER_RUN', 3)
+  def test_count_after_failure(self):
+    """Test that only the outputs written before a failed run are counted."""
+    self._mock_radamsa_runs([(3, 0), (1, 1)])
+
+    self.assertEqual(4, self._generate())
+    self.assertEqual(4, len(os.listdir('/mutations')))
+
+  @mock.patch('bot.fuzzers.engine_common.RADAMSA_MUTATIONS', 6)
+  @mock.patch('bot.fuzzers.engine_common.RADAMSA_MUTATIONS_PER_RUN', 3)
+  def test_batches(self):
+    """Test that mutations are generated in batches of
+    RADAMSA_MUTATIONS_PER_RUN."""
+    self._mock_radamsa_runs([(3, 0), (3, 0)])
+
+    self.assertEqual(6, self._generate())
+    self.assertEqual(2, self.mock.run_and_wait.call_count)
+    for call in self.mock.run_and_wait.call_args_list:
+      args = call[0][1]
+      self.assertEqual(['-n', '3', '-o'], args[:3])
+      self.assertItemsEqual(['/corpus/a', '/corpus/b'], args[4:])
+
+    self.assertItemsEqual([
+        'radamsa-00000001-1',
+        'radamsa-00000001-2',
+        'radamsa-00000001-3',
+        'radamsa-00000002-1',
+        'radamsa-00000002-2',
+        'radamsa-00000002-3',
+    ], os.listdir('/mutations'))
+
+  @mock.patch('bot.fuzzers.engine_common.RADAMSA_MUTATIONS', 9)
+  @mock.patch('bot.fuzzers.engine_common.RADAMSA_MUTATIONS_PER_RUN', 3)
+  @mock.patch('bot.fuzzers.engine_common.time')
+  def test_deadline(self, mock_time):
+    """Test that no more runs are started once the generation timeout is
+    exceeded, and that each run is limited to the remaining time."""
+    mock_time.time.side_effect = [0, 0, 595, 600]
+    self._mock_radamsa_runs([(3, 0), (3, 0)])
+
+    self.assertEqual(6, self._generate(generation_timeout=600))
+    self.assertEqual(2, self.mock.run_and_wait.call_count)
+    self.assertEqual([9, 5], [
+        call[1]['timeout'] for call in self.mock.run_and_wait.call_args_list
+    ])
+
+
+class GenerateNewTestcaseMutationsUsingMlRnnTest(
+    fake_filesystem_unittest.TestCase):
+  """generate_new_testcase_mutations_using_ml_rnn tests."""
+
+  def setUp(self):
+    test_helpers.patch_environ(self)
+    test_utils.set_up_pyfakefs(self)
+    test_helpers.patch(self, [
+        'bot.fuzzers.ml.rnn.generator.prepare_model_directory',
+        'bot.fuzzers.ml.rnn.generator.run',
+        'metrics.logs.log_error',
+    ])
+    os.environ['OS_OVERRIDE'] = 'LINUX'
+    self.mock.prepare_model_directory.return_value = '/model'
+
+    self.fs.create_file('/corpus/a', contents='a')
+    self.fs.create_file('/mutations/existing', contents='b')
+
+  def _mock_run(self, num_outputs, return_code):
+    """Returns a mock generator run that writes |num_outputs| outputs."""
+
+    def run(input_directory, output_directory, model_path, generation_timeout):
+      """Mock run."""
+      for i in range(num_outputs):
+        self.fs.create_file(os.path.join(output_directory, 'ml-%d' % i))
+
+      return new_process.ProcessResult(
+          return_code=return_code, output='', timed_out=False)
+
+    return run
+
+  def _generate(self):
+    return engine_common.generate_new_testcase_mutations_using_ml_rnn(
+        '/corpus', '/mutations', 'fuzzer', 600)
+
+  def test_count(self):
+    """Test that new outputs are counted, excluding existing ones."""
+    self.mock.run.side_effect = self._mock_run(
+        2, ml_rnn_constants.ExitCode.SUCCESS)
+    self.assertEqual(2, self._generate())
+
+  def test_count_after_failure(self):
+    """Test that outputs written before a failure are counted."""
+    self.mock.run.side_effect = self._mock_run(
+        2, ml_rnn_constants.ExitCode.TENSORFLOW_ERROR)
+    self.assertEqual(2, self._generate())
+
 
 class GetStrategyProbabilityTest(unittest.TestCase):
   """Tests get_strategy_probability."""
@@ -373,6 +557,8 @@ class UnpackSeedCorpusIfNeededTest(fake_filesystem_unittest.TestCase):
 
     test_utils.set_up_pyfakefs(self)
     self.fs.create_dir(self.CORPUS_DIRECTORY)
+    # pylint: disable=protected-access
+    engine_common._unpacked_seed_corpora.clear()
 
   def _unpack_seed_corpus_if_needed(self, *args, **kwargs):
     return engine_common.unpack_seed_corpus_if_needed(
@@ -459,3 +645,32 @@ class UnpackSeedCorpusIfNeededTest(fake_filesystem_unittest.TestCase):
     self._write_seed_corpus(self.seed_corpus_subdirs_contents, '.zip')
     self._unpack_seed_corpus_if_needed()
     self._assert_elements_equal(expected_dir_contents, self._list_corpus_dir())
+
+  @mock.patch('system.archive.iterator', side_effect=archive.iterator)
+  def test_seed_corpus_already_unpacked(self, mock_iterator):
+    """Test unpack_seed_corpus_if_needed does not unpack an unchanged seed
+    corpus again into the same corpus directory."""
+    self._write_seed_corpus(self.zip_seed_corpus_contents, '.zip')
+    self._unpack_seed_corpus_if_needed()
+    self._unpack_seed_corpus_if_needed()
+    self.assertEqual(1, mock_iterator.call_count)
+    self._assert_elements_equal(
+        ['0000000000000000', '0000000000000001', '0000000000000002'],
+        self._list_corpus_dir())
+
+    # Unpack again once any of the unpacked files is removed.
+    os.remove(os.path.join(self.CORPUS_DIRECTORY, '0000000000000000'))
+    self._unpack_seed_corpus_if_needed()
+    self.assertEqual(2, mock_iterator.call_count)
+    self._assert_elements_equal(
+        ['0000000000000000', '0000000000000001', '0000000000000002'],
+        self._list_corpus_dir())
+
+    # Unpack again once the seed corpus changes.
+    self._write_seed_corpus(self.targz_seed_corpus_contents, '.tar.gz')
+    os.remove(self.FUZZ_TARGET_PATH + engine_common.SEED_CORPUS_ARCHIVE_SUFFIX +
+              '.zip')
+    self._unpack_seed_corpus_if_needed()
+    self._assert_elements_equal(
+        ['0000000000000000', '0000000000000001', '0000000000000002'],
+        self._list_corpus_dir())
@@ -12,7 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Tests for libFuzzer engine."""
-# pylint: disable=unused-argument
+# pylint: disable=protected-access,unused-argument
 
 from future import standard_library
 standard_library.install_aliases()
@@ -113,6 +113,63 @@ class PrepareTest(fake_fs_unittest.TestCase):
     ], options.arguments)
 
 
+class CreateTempCorpusDirTest(fake_fs_unittest.TestCase):
+  """_create_temp_corpus_dir() tests."""
+
+  def setUp(self):
+    test_helpers.patch_environ(self)
+    test_utils.set_up_pyfakefs(self)
+
+    test_helpers.patch(self, [
+        'bot.fuzzers.engine_common.recreate_directory',
+        'bot.fuzzers.libFuzzer.engine._remove_directories_in_background',
+        'os.getpid',
+    ])
+
+    # Remove directories synchronously, so that the test can check them.
+    self.mock._remove_directories_in_background.side_effect = (
+        engine._remove_directories)
+    self.mock.getpid.return_value = 9001
+    os.environ['FUZZ_INPUTS_DISK'] = '/fuzz-inputs'
+    self.fs.create_dir('/fuzz-inputs/temp-9001')
+
+  def _create_temp_corpus_dir(self, name):
+    engine_impl = engine.LibFuzzerEngine()
+    return engine_impl._create_temp_corpus_dir(name)
+
+  def test_existing_directory(self):
+    """Test that a leftover directory is replaced with an empty one and
+    removed, along with stale trash directories."""
+    self.fs.create_file('/fuzz-inputs/temp-9001/new/A')
+    self.fs.create_file('/fuzz-inputs/temp-9001/new.trash.stale/new/B')
+
+    self.assertEqual('/fuzz-inputs/temp-9001/new',
+                     self._create_temp_corpus_dir('new'))
+    self.assertEqual([], os.listdir('/fuzz-inputs/temp-9001/new'))
+    self.assertEqual(['new'], os.listdir('/fuzz-inputs/temp-9001'))
+    self.assertFalse(self.mock.recreate_directory.called)
+
+  def test_new_directory(self):
+    """Test that a missing directory is created."""
+    self.assertEqual('/fuzz-inputs/temp-9001/new',
+                     self._create_temp_corpus_dir('new'))
+    self.mock.recreate_directory.assert_called_with(
+        '/fuzz-inputs/temp-9001/new')
+    self.assertFalse(self.mock._remove_directories_in_background.called)
+
+  def test_windows(self):
+    """Test that directories are recreated in place on Windows."""
+    os.environ['OS_OVERRIDE'] = 'WINDOWS'
+    self.fs.create_file('/fuzz-inputs/temp-9001/new/A')
+
+    self.assertEqual('/fuzz-inputs/temp-9001/new',
+                     self._create_temp_corpus_dir('new'))
+    self.mock.recreate_directory.assert_called_with(
+        '/fuzz-inputs/temp-9001/new')
+    self.assertEqual(['new'], os.listdir('/fuzz-inputs/temp-9001'))
+    self.assertFalse(self.mock._remove_directories_in_background.called)
+
+
 class FuzzTest(fake_fs_unittest.TestCase):
   """Fuzz() tests."""
 
@@ -254,3 +311,64 @@ class FuzzTest(fake_fs_unittest.TestCase):
             'timeout_limit': 123,
         },
         result.stats)
+
+  def test_fuzz_multiple_crashes(self):
+    """Test fuzz reports the first crash testcase written."""
+    engine_impl = engine.LibFuzzerEngine()
+    options = engine.LibFuzzerOptions('/corpus', ['-timeout=123'], [],
+                                      ['/corpus'], {}, False, False)
+
+    fuzz_output = ('INFO: Seed: 1337\n'
+                   'Test unit written to /fake/crash-first\n'
+                   'Test unit written to /fake/leak-second\n')
+    self.mock.fuzz.return_value = new_process.ProcessResult(
+        command='command',
+        return_code=1,
+        output=fuzz_output,
+        time_executed=2.0,
+        timed_out=False)
+
+    result = engine_impl.fuzz('/target', options, '/fake', 3600)
+    self.assertEqual(1, len(result.crashes))
+    self.assertEqual('/fake/crash-first', result.crashes[0].input_path)
+    self.assertFalse(self.mock.merge.called)
+
+
+class MinimizeCorpusTest(fake_fs_unittest.TestCase):
+  """minimize_corpus tests."""
+
+  def setUp(self):
+    test_helpers.patch_environ(self)
+    test_utils.set_up_pyfakefs(self)
+
+    self.fs.create_dir('/fuzz-inputs')
+    self.fs.create_file('/target')
+
+    test_helpers.patch(self, [
+        'bot.fuzzers.libfuzzer.LibFuzzerRunner.merge',
+        'os.getpid',
+    ])
+
+    os.environ['JOB_NAME'] = 'libfuzzer_asan_job'
+    os.environ['FUZZ_INPUTS_DISK'] = '/fuzz-inputs'
+    self.mock.getpid.return_value = 9001
+
+  def test_minimize_corpus(self):
+    """Test that minimize_corpus merges with set cover merge."""
+    self.mock.merge.return_value = new_process.ProcessResult(
+        command='merge-command',
+        return_code=0,
+        output='merge',
+        time_executed=2.0,
+        timed_out=False)
+
+    engine_impl = engine.LibFuzzerEngine()
+    result = engine_impl.minimize_corpus('/target', ['-timeout=123'],
+                                         '/output', ['/input1', '/input2'], 120)
+    self.assertEqual('merge', result.logs)
+
+    self.mock.merge.assert_called_with(
+        mock.ANY, ['/output', '/input1', '/input2'],
+        additional_args=['-timeout=123', '-set_cover_merge=1'],
+        merge_timeout=120,
+        tmp_dir='/fuzz-inputs/temp-9001/merge-workdir')
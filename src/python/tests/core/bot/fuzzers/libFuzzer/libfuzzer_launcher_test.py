@@ -721,6 +721,18 @@ class LauncherTest(fake_fs_unittest.TestCase):
 
     self.assertEqual(parsed_stats, expected_stats)
 
+  def test_parse_all(self):
+    """Test that single pass parsing matches parsing stats and performance
+    features separately."""
+    for output in (self.no_crash_output_with_strategies, self.crash_output):
+      log_lines = output.splitlines()
+      expected_stats = launcher.parse_log_stats(log_lines)
+      expected_stats.update(
+          stats.parse_performance_features(log_lines, [], ['-max_len=1337']))
+
+      self.assertEqual(
+          stats.parse_all(log_lines, [], ['-max_len=1337']), expected_stats)
+
   def test_parse_log_and_stats_crash(self):
     """Test stats parsing and additional performance features extraction
     without applying of stat_overrides."""
@@ -2488,6 +2500,24 @@ class RecommendedDictionaryTest(fake_fs_unittest.TestCase):
         self.mock.download_recommended_dictionary_from_gcs.call_args[0])
 
 
+class FindCrashTestcasePathTest(unittest.TestCase):
+  """Tests for find_crash_testcase_path."""
+
+  def test_no_crash(self):
+    """Tests that None is returned when no crash testcase was written."""
+    self.assertIsNone(launcher.find_crash_testcase_path('INFO: Done\n'))
+
+  def test_crash(self):
+    """Tests that the first crash testcase path is returned, skipping other
+    written units."""
+    output = ('#1 INITED\n'
+              'Test unit written to ./slow-unit-123\n'
+              'Test unit written to /fake/crash-abc\r\n'
+              'Test unit written to /fake/oom-def\n')
+    self.assertEqual('/fake/crash-abc',
+                     launcher.find_crash_testcase_path(output))
+
+
 class IsSha1HashTest(unittest.TestCase):
   """Tests for is_sha1_hash."""
 
@@ -2514,7 +2544,8 @@ class MoveMergeableUnitsTest(fake_fs_unittest.TestCase):
 
   def move_mergeable_units(self):
     """Helper function for move_mergeable_units."""
-    launcher.move_mergeable_units(self.MERGE_DIRECTORY, self.CORPUS_DIRECTORY)
+    return launcher.move_mergeable_units(self.MERGE_DIRECTORY,
+                                         self.CORPUS_DIRECTORY)
 
   def test_duplicate_not_moved(self):
     """Tests that a duplicated file is not moved into the corpus directory."""
@@ -2522,7 +2553,7 @@ class MoveMergeableUnitsTest(fake_fs_unittest.TestCase):
         os.path.join(self.CORPUS_DIRECTORY, ARBITRARY_SHA1_HASH))
     merge_corpus_file = os.path.join(self.MERGE_DIRECTORY, ARBITRARY_SHA1_HASH)
     self.fs.create_file(merge_corpus_file)
-    self.move_mergeable_units()
+    self.assertEqual(0, self.move_mergeable_units())
     # File will be deleted from merge directory if it isn't a duplicate.
     self.assertTrue(os.path.exists(merge_corpus_file))
 
@@ -2536,7 +2567,7 @@ class MoveMergeableUnitsTest(fake_fs_unittest.TestCase):
     # filename.
     merge_corpus_file = os.path.join(self.MERGE_DIRECTORY, ARBITRARY_SHA1_HASH)
     self.fs.create_file(merge_corpus_file)
-    self.move_mergeable_units()
+    self.assertEqual(1, self.move_mergeable_units())
     # File will be deleted from merge directory if it isn't a duplicate.
     self.assertFalse(os.path.exists(merge_corpus_file))
     self.assertTrue(
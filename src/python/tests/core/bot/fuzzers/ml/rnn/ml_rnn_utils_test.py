@@ -0,0 +1,58 @@
+# Copyright 2019 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for ML RNN utils."""
+
+import numpy as np
+import unittest
+
+from bot.fuzzers.ml.rnn import constants
+from bot.fuzzers.ml.rnn import utils
+
+BATCH_SIZE = 64
+
+
+class SampleBatchFromProbabilitiesTest(unittest.TestCase):
+  """sample_batch_from_probabilities tests."""
+
+  def setUp(self):
+    np.random.seed(0)
+
+  def test_shape_and_bounds(self):
+    """Test that one index within the alphabet is sampled for each row."""
+    probabilities = np.random.random_sample((BATCH_SIZE, constants.ALPHA_SIZE))
+    probabilities /= probabilities.sum(axis=1)[:, np.newaxis]
+
+    for topn in [1, 2, constants.ALPHA_SIZE]:
+      choices = utils.sample_batch_from_probabilities(probabilities, topn=topn)
+      self.assertEqual((BATCH_SIZE,), choices.shape)
+      self.assertTrue(np.all(choices >= 0))
+      self.assertTrue(np.all(choices < constants.ALPHA_SIZE))
+
+  def test_top_probability(self):
+    """Test that only the highest probability is picked when topn is 1."""
+    probabilities = np.random.random_sample((BATCH_SIZE, constants.ALPHA_SIZE))
+
+    choices = utils.sample_batch_from_probabilities(probabilities, topn=1)
+    np.testing.assert_array_equal(np.argmax(probabilities, axis=1), choices)
+
+  def test_one_hot(self):
+    """Test that a one-hot row always yields its index."""
+    indices = np.random.randint(constants.ALPHA_SIZE, size=BATCH_SIZE)
+    indices[:2] = [0, constants.ALPHA_SIZE - 1]
+    probabilities = np.zeros((BATCH_SIZE, constants.ALPHA_SIZE))
+    probabilities[np.arange(BATCH_SIZE), indices] = 1
+
+    for _ in range(10):
+      choices = utils.sample_batch_from_probabilities(probabilities)
+      np.testing.assert_array_equal(indices, choices)
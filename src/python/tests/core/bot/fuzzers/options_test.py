@@ -100,3 +100,14 @@ class GetFuzzTargetOptions(fake_filesystem_unittest.TestCase):
   def test_not_exist(self):
     self.assertEqual(self._get_arguments('/path/not_exist'), None)
     self.assertEqual(self._get_arguments('/path/not_exist.exe'), None)
+
+  def test_options_file_updated(self):
+    """Test that an updated options file is parsed again."""
+    self.assertEqual(
+        self._get_arguments('/path/fuzz_target'), ['-close_fd_mask=1'])
+
+    with open('/path/fuzz_target.options', 'w') as file_handle:
+      file_handle.write('[libfuzzer]\n' 'close_fd_mask=3\n' 'max_len=10\n')
+    self.assertEqual(
+        self._get_arguments('/path/fuzz_target'),
+        ['-close_fd_mask=3', '-max_len=10'])
@@ -494,6 +494,40 @@ class GetProjectNameTest(unittest.TestCase):
     self.assertEqual('test-project', data_handler.get_project_name('job'))
 
 
+@test_utils.with_cloud_emulators('datastore')
+class GetAdditionalValuesForVariablesTest(unittest.TestCase):
+  """Test get_additional_values_for_variables."""
+
+  def test_get_values(self):
+    """Test combining values from the job and fuzzer."""
+    data_types.Job(
+        name='job',
+        environment_string=('AUTOMATIC_LABELS = label1, label2\n'
+                            'AUTOMATIC_CCS = a@example.com\n')).put()
+    data_types.Fuzzer(
+        name='fuzzer',
+        additional_environment_string='AUTOMATIC_LABELS = label3\n').put()
+
+    self.assertDictEqual({
+        'AUTOMATIC_LABELS': ['label1', 'label2', 'label3'],
+        'AUTOMATIC_COMPONENTS': [],
+        'AUTOMATIC_CCS': ['a@example.com'],
+    },
+                         data_handler.get_additional_values_for_variables(
+                             [
+                                 'AUTOMATIC_LABELS', 'AUTOMATIC_COMPONENTS',
+                                 'AUTOMATIC_CCS'
+                             ], 'job', 'fuzzer'))
+
+  def test_no_job_or_fuzzer(self):
+    """Test that empty lists are returned for a missing job and fuzzer."""
+    self.assertDictEqual({
+        'AUTOMATIC_LABELS': []
+    },
+                         data_handler.get_additional_values_for_variables(
+                             ['AUTOMATIC_LABELS'], 'job', 'fuzzer'))
+
+
 class GetSecuritySeverityTest(unittest.TestCase):
   """Test _get_security_severity."""
 
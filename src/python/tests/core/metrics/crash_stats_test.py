@@ -13,10 +13,13 @@
 # limitations under the License.
 """crash_stats tests."""
 from builtins import range
+import mock
 import unittest
 
 from datastore import data_types
+from google_cloud_utils import big_query
 from metrics import crash_stats
+from tests.test_libs import helpers
 from tests.test_libs import test_utils
 
 
@@ -41,6 +44,49 @@ class GetLastSuccessfulHourTest(unittest.TestCase):
     self.assertEqual(15, crash_stats.get_last_successful_hour())
 
 
+class GetCrashDaysAndCountTest(unittest.TestCase):
+  """Test get_crash_days_and_count."""
+
+  def setUp(self):
+    self.client = mock.Mock(spec_set=big_query.Client)
+    helpers.patch(self, [
+        'google_cloud_utils.big_query.Client',
+    ])
+    self.mock.Client.return_value = self.client
+
+  def test_counts(self):
+    """Test that the counts are returned from the first row."""
+    self.client.query.return_value = big_query.QueryResult(
+        rows=[{
+            'crash_days': 14,
+            'total_count': 140
+        }], total_count=1)
+    self.assertEqual((14, 140),
+                     crash_stats.get_crash_days_and_count(
+                         end=417325,
+                         days=14,
+                         crash_type='Heap-buffer-overflow',
+                         crash_state='state',
+                         security_flag=True))
+
+    sql = self.client.query.call_args[1]['query']
+    self.assertIn('crash_type = "Heap-buffer-overflow"', sql)
+    self.assertIn('security_flag = true', sql)
+    self.assertIn('(hour BETWEEN 416990 AND 417325)', sql)
+
+  def test_no_rows(self):
+    """Test that zero counts are returned when there are no crashes."""
+    self.client.query.return_value = big_query.QueryResult(
+        rows=[], total_count=0)
+    self.assertEqual((0, 0),
+                     crash_stats.get_crash_days_and_count(
+                         end=417325,
+                         days=14,
+                         crash_type='Heap-buffer-overflow',
+                         crash_state='state',
+                         security_flag=True))
+
+
 def bq_convert_hour_to_index(hour, time_span, remainder):
   """Convert hour to index according to the SQL."""
   return (hour - remainder) // time_span
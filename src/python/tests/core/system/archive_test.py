@@ -53,6 +53,17 @@ class IteratorTest(unittest.TestCase):
     }
     self.assertEqual(actual_results, expected_results)
 
+  def test_max_file_size(self):
+    """Test that files larger than max_file_size are skipped by iterator()."""
+    tar_xz_path = os.path.join(TESTDATA_PATH, 'archive.tar.xz')
+    expected_results = {'archive_dir/hi': 'hi\n'}
+    actual_results = {
+        archive_file.name: archive_file.handle.read()
+        for archive_file in archive.iterator(tar_xz_path, max_file_size=3)
+        if archive_file.handle
+    }
+    self.assertEqual(actual_results, expected_results)
+
   def test_cwd_prefix(self):
     """Test that a .tgz file with cwd prefix is handled."""
     tgz_path = os.path.join(TESTDATA_PATH, 'cwd-prefix.tgz')
@@ -182,6 +182,25 @@ class GetDirectoryFileCount(fake_filesystem_unittest.TestCase):
     self.assertEqual(shell.get_directory_file_count('/test/aa'), 4)
 
 
+class DirectoryHasMoreFilesThanTest(fake_filesystem_unittest.TestCase):
+  """Tests for directory_has_more_files_than."""
+
+  def setUp(self):
+    test_utils.set_up_pyfakefs(self)
+
+  def test(self):
+    """Test directory_has_more_files_than."""
+    self.fs.create_file('/test/aa/bb.txt', contents='abc')
+    self.fs.create_file('/test/aa/cc.txt', contents='def')
+    self.fs.create_file('/test/aa/aa/aa.txt', contents='ghi')
+    self.fs.create_file('/test/aa/aa/dd.txt', contents='t')
+
+    self.assertTrue(shell.directory_has_more_files_than('/test/aa', 0))
+    self.assertTrue(shell.directory_has_more_files_than('/test/aa', 3))
+    self.assertFalse(shell.directory_has_more_files_than('/test/aa', 4))
+    self.assertFalse(shell.directory_has_more_files_than('/test/bb', 0))
+
+
 class GetDirectorySizeTest(fake_filesystem_unittest.TestCase):
   """Tests for get_directory_size."""
 